@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import config
+
+PRIORITIES = ("interactive", "batch")
+
+class Overloaded(Exception):
+    """Raised when a request is shed; retry_after is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Waiter:
+    def __init__(self, client_id: str, priority: str, deadline: float, seq: int):
+        self.client_id = client_id
+        self.priority = priority
+        self.deadline = deadline
+        self.seq = seq
+        self.future = asyncio.get_running_loop().create_future()
+
+class AdmissionController:
+    """
+    Bounds how many councils run at once and queues the rest.
+
+    Waiting requests are served by strict priority class (interactive before batch) and
+    round-robin across clients within a class, so one chatty client can't starve the others.
+    A request is rejected up front when the queue is full or its predicted wait, from a moving
+    average of council latency, exceeds its deadline; a queued request that outlives its
+    deadline is dropped instead of running late. A full queue sheds its newest lowest-priority
+    waiter to make room for a higher priority request.
+    """
+
+    def __init__(self, max_concurrency: int = config.ADMISSION_MAX_CONCURRENCY,
+                 max_queue: int = config.ADMISSION_MAX_QUEUE,
+                 initial_service_time: float = config.ADMISSION_INITIAL_SERVICE_TIME_S):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.service_time = initial_service_time  # moving average of council latency, seconds
+        # priority -> client id -> FIFO of waiters; OrderedDict order is the round-robin order
+        self.queues: Dict[str, OrderedDict] = {priority: OrderedDict() for priority in PRIORITIES}
+        self.queued = 0
+        self._seq = itertools.count()
+        self.stats = {"admitted": 0, "rejected": 0, "shed": 0, "expired": 0}
+
+    def _queued_ahead(self, priority: str) -> int:
+        rank = PRIORITIES.index(priority)
+        return sum(len(waiters) for p in PRIORITIES[:rank + 1] for waiters in self.queues[p].values())
+
+    def predicted_wait(self, priority: str) -> float:
+        if self.running < self.max_concurrency:
+            return 0.0
+        # Everyone ahead plus this request, drained max_concurrency at a time
+        rounds = self._queued_ahead(priority) // self.max_concurrency + 1
+        return rounds * self.service_time
+
+    def _enqueue(self, waiter: _Waiter):
+        self.queues[waiter.priority].setdefault(waiter.client_id, deque()).append(waiter)
+        self.queued += 1
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        waiters = self.queues[waiter.priority].get(waiter.client_id)
+        if not waiters or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        if not waiters:
+            del self.queues[waiter.priority][waiter.client_id]
+        self.queued -= 1
+        return True
+
+    def _shed_lower_priority(self, priority: str) -> bool:
+        """Reject the newest waiter of the lowest class below priority to free a queue slot."""
+        for lower in reversed(PRIORITIES[PRIORITIES.index(priority) + 1:]):
+            waiters = [w for queue in self.queues[lower].values() for w in queue]
+            if waiters:
+                victim = max(waiters, key=lambda w: w.seq)
+                self._remove(victim)
+                victim.future.set_exception(Overloaded("Shed for higher priority traffic", self.service_time))
+                self.stats["shed"] += 1
+                return True
+        return False
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                # Take the head client's oldest waiter, then move that client to the back
+                client_id, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                self.queued -= 1
+                if waiters:
+                    queue.move_to_end(client_id)
+                else:
+                    del queue[client_id]
+                if waiter.future.done():
+                    continue
+                if waiter.deadline <= now:
+                    waiter.future.set_exception(Overloaded("Deadline passed while queued", self.service_time))
+                    self.stats["expired"] += 1
+                    continue
+                return waiter
+        return None
+
+    def _release(self, elapsed: Optional[float]):
+        if elapsed is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        waiter = self._next_waiter()
+        if waiter:
+            # The slot passes straight to the next waiter
+            waiter.future.set_result(None)
+        else:
+            self.running -= 1
+
+    async def _acquire(self, client_id: str, priority: str, deadline_s: float):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+            return
+        predicted = self.predicted_wait(priority)
+        if predicted > deadline_s:
+            self.stats["rejected"] += 1
+            raise Overloaded(f"Predicted wait {predicted:.1f}s exceeds deadline {deadline_s:.1f}s", predicted)
+        if self.queued >= self.max_queue and not self._shed_lower_priority(priority):
+            self.stats["rejected"] += 1
+            raise Overloaded("Admission queue is full", predicted)
+
+        waiter = _Waiter(client_id, priority, time.monotonic() + deadline_s, next(self._seq))
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            if self._remove(waiter):
+                self.stats["expired"] += 1
+                raise Overloaded("Deadline passed while queued", self.service_time)
+            # Granted a slot at the same moment the deadline passed: hand it on
+            if not waiter.future.exception():
+                self._release(None)
+            raise Overloaded("Deadline passed while queued", self.service_time)
+        except asyncio.CancelledError:
+            # Client went away: leave the queue, or pass on a slot that was already granted
+            if not self._remove(waiter) and waiter.future.done() and not waiter.future.exception():
+                self._release(None)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, client_id: str, priority: str = "interactive", deadline_s: Optional[float] = None):
+        """Hold one council slot for the duration of the block; raises Overloaded when shed."""
+        if deadline_s is None:
+            deadline_s = config.ADMISSION_DEADLINE_S[priority]
+        await self._acquire(client_id, priority, deadline_s)
+        self.stats["admitted"] += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def snapshot(self) -> Dict:
+        return dict(
+            self.stats,
+            running=self.running,
+            queued={priority: sum(len(w) for w in self.queues[priority].values()) for priority in PRIORITIES},
+            service_time_s=round(self.service_time, 3),
+        )
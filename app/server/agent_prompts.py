@@ -71,3 +71,46 @@ def get_prompt_for_council_member(key: str) -> str:
 
 def get_prompt_for_council_leader():
     return PROMPT_FOR_JUDGE
+
+
+PROMPT_FOR_SINGLE_CALL_COUNCIL = (
+    "You are simulating an entire council of domain experts that reviews prompts submitted to a large language model (LLM). "
+    "Evaluate the prompt once from the perspective of **each** expert listed below, independently of the others.\n\n"
+
+    "Every expert follows these guidelines:\n"
+    "- You are evaluating a **user-submitted prompt to an LLM**, not a human conversation\n"
+    "- Comment **only** on risks specific to the expert's own field\n"
+    "- Focus on **real, contextual risks**, not isolated keywords\n"
+    "- Recommend rejecting the prompt only when there's a 97% confidence of a real danger\n\n"
+
+    "Experts:\n"
+    "{experts}\n\n"
+
+    "Respond with a JSON array only, with exactly one object per expert, in this form:\n"
+    '[{{"agent_name": "<expert key>", "verdict": "Permitted" or "Not Permitted", "evaluation": "<one or two sentences>"}}]'
+)
+
+
+def get_prompt_for_single_call_council(keys: list) -> str:
+    """
+    Pack the personas of the given council members into one prompt that asks for
+    a JSON array with one verdict per expert.
+    """
+    experts = []
+    for key in keys:
+        if key not in ADDED_PROMPT_DICT:
+            raise ValueError("Prompt title does not exist.")
+        experts.append(f"- {key}: {ADDED_PROMPT_DICT[key]}")
+    return PROMPT_FOR_SINGLE_CALL_COUNCIL.format(experts="\n".join(experts))
+
+
+PROMPT_FOR_TOOL_CALLING_JUDGE_SUFFIX = (
+    "\n\nYou gather the expert evaluations yourself with your tools, one tool per expert. "
+    "Call **every** expert tool in a single turn so they run in parallel, then give your final verdict "
+    "without calling any tool again. The tools already know the prompt under review."
+)
+
+
+def get_prompt_for_tool_calling_council_leader() -> str:
+    """Judge instruction for the ADK council, where the judge calls the experts as tools."""
+    return PROMPT_FOR_JUDGE + PROMPT_FOR_TOOL_CALLING_JUDGE_SUFFIX
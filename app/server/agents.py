@@ -3,14 +3,61 @@ import google.generativeai as genai
 import asyncio
 from dataclasses import dataclass
 import json
-from agent_prompts import get_prompt_for_council_member, get_prompt_for_council_leader, ADDED_PROMPT_DICT
+from agent_prompts import get_prompt_for_council_member, get_prompt_for_council_leader, get_prompt_for_single_call_council, ADDED_PROMPT_DICT
 import logging
+import re
+import time
 import rag
+from budget import TokenBudget, default_budget, response_usage
 import os
 import config
 
 logger = logging.getLogger(__name__)
 
+COUNCIL_MODES = ("fanout", "single_call", "adk")
+
+# Terms that send a prompt to the high risk tier during pre-screening
+HIGH_RISK_TERMS = (
+    "ignore previous", "ignore all previous", "jailbreak", "bypass", "pretend you are", "roleplay as",
+    "no restrictions", "developer mode", "weapon", "bomb", "explosive", "poison", "malware",
+    "ransomware", "exploit", "hack", "kill", "suicide", "drug", "minor", "child", "children",
+)
+# Whole words only, with common inflections: "bombs" and "hacking" match, "hackathon" and "minority" don't
+HIGH_RISK_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(term) for term in HIGH_RISK_TERMS) + r")(?:s|es|ed|ing|er|ers)?\b"
+)
+# Digits and symbols commonly swapped for letters, e.g. "b0mb", "h@ck", "$uicide"
+LEET_TRANSLATION = str.maketrans("0134579@$", "oieastgas")
+
+def prescreen_risk_tier(prompt: str) -> str:
+    """
+    Cheap local pre-screen. Returns "high" if the prompt mentions any high risk term, "low" otherwise.
+    A routing hint only: a high tier escalates single_call to the full council, a low tier never
+    lets a prompt skip it.
+    """
+    words = re.findall(r"[a-z0-9@$']+", prompt.lower())
+    text = " ".join(word.translate(LEET_TRANSLATION) for word in words)
+    return "high" if HIGH_RISK_PATTERN.search(text) else "low"
+
+def parse_verdict(text: str) -> Optional[str]:
+    """"Not Permitted" or "Permitted", whichever the text states, or None if it states neither."""
+    text = text.lower()
+    if "not permitted" in text:
+        return "Not Permitted"
+    if "permitted" in text:
+        return "Permitted"
+    return None
+
+def _parse_json_array(text: str) -> List[Dict]:
+    """Extract the JSON array from a model response, tolerating markdown code fences."""
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON array in response")
+    parsed = json.loads(text[start:end + 1])
+    if not isinstance(parsed, list):
+        raise ValueError("Response is not a JSON array")
+    return parsed
+
 @dataclass
 class AgentConfig:
     name: str
@@ -20,46 +67,76 @@ class AgentConfig:
     rag_path: Optional[str] = None  # Path to PDF file for RAG, None if no RAG needed
 
 class Agent:
-    def __init__(self, config: AgentConfig, model=None):
+    def __init__(self, config: AgentConfig, model=None, knowledge_store: Optional[rag.KnowledgeStore] = None,
+                 token_budget: Optional[TokenBudget] = None):
         self.config = config
         self.model = model or self._setup_model()
-        self.rag = rag.PDFRag(config.rag_path) if config.rag_path and os.path.exists(config.rag_path) else None
+        self.budget = token_budget or default_budget
+        if knowledge_store is not None and config.rag_path:
+            # The view resolves on every query, so a document published later is picked up
+            self.rag = knowledge_store.view([config.rag_path])
+        else:
+            self.rag = rag.PDFRag(config.rag_path) if config.rag_path and os.path.exists(config.rag_path) else None
     
     def _setup_model(self):
         genai.configure(api_key=self.config.api_key)
         return genai.GenerativeModel(config.GEMINI_MODEL_NAME)
     
-    async def analyze_prompt(self, prompt: str) -> Dict:
+    async def analyze_prompt(self, prompt: str, rag_chunks: Optional[List[str]] = None) -> Dict:
         """
         Analyze a prompt and return a structured response with the agent's evaluation.
+        rag_chunks can carry context already retrieved for this agent by the AgentManager.
         """
+        start = time.perf_counter()
         try:
             chat = self.model.start_chat(history=[])
             
-            # Get RAG context if available
+            # Get RAG context if available, trimmed to the expert input budget
             rag_context = ""
+            dropped = 0
             if self.rag:
-                rag_chunks = self.rag.get_rag_context(prompt, num_chunks=5)
+                if rag_chunks is None:
+                    try:
+                        rag_chunks = await asyncio.to_thread(self.rag.get_rag_context, prompt)
+                    except Exception as e:
+                        logger.error(f"RAG retrieval failed for agent {self.config.name}, evaluating without context: {str(e)}")
+            if rag_chunks:
+                rag_chunks, dropped = await asyncio.to_thread(
+                    self.budget.fit_context, f"{self.config.system_prompt}\n{prompt}", rag_chunks
+                )
+            if rag_chunks:
                 rag_context = "\n\nRelevant context from knowledge base:\n" + "\n---\n".join(rag_chunks)
             else:
                 logger.info(f"No RAG context available for agent {self.config.name}")
             
+            message = (
+                f"{self.config.system_prompt}\n\n{rag_context}\n\nAnalyze this prompt: {prompt}\n\n"
+                f"Provide your evaluation in a clear and structured format, in at most {self.budget.output_words('expert')} words."
+            )
             response = await asyncio.to_thread(
                 chat.send_message,
-                f"{self.config.system_prompt}\n\n{rag_context}\n\nAnalyze this prompt: {prompt}\n\nProvide your evaluation in a clear and structured format."
+                message,
+                generation_config=self.budget.generation_config("expert")
             )
+            usage = response_usage(response)
+            self.budget.counter.observe(message, usage["prompt_tokens"])
             
             return {
                 "agent_name": self.config.name,
                 "evaluation": response.text.strip(),
-                "weight": self.config.weight
+                "weight": self.config.weight,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "rag_chunks_dropped": dropped,
+                **usage
             }
         except Exception as e:
-            print(f"Error in agent {self.config.name}: {str(e)}")
+            logger.error(f"Error in agent {self.config.name}: {str(e)}")
             return {
                 "agent_name": self.config.name,
                 "evaluation": "Error occurred during evaluation",
-                "weight": self.config.weight
+                "weight": self.config.weight,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "error": str(e)
             }
 
 class JudgeAgent(Agent):
@@ -68,6 +145,7 @@ class JudgeAgent(Agent):
         Make a final decision based on all agent evaluations.
         Returns a dict with the verdict and explanation.
         """
+        start = time.perf_counter()
         try:
             # Format evaluations for explanation
             evaluations_text = "\n\n".join([
@@ -78,14 +156,17 @@ class JudgeAgent(Agent):
             chat = self.model.start_chat(history=[])
             response = await asyncio.to_thread(
                 chat.send_message,
-                f"{self.config.system_prompt}\n\nOriginal prompt: {prompt}\n\nExpert evaluations:\n{evaluations_text}\n\nPlease provide your final verdict."
+                f"{self.config.system_prompt}\n\nOriginal prompt: {prompt}\n\nExpert evaluations:\n{evaluations_text}\n\n"
+                f"Please provide your final verdict, in at most {self.budget.output_words('judge')} words.",
+                generation_config=self.budget.generation_config("judge")
             )
             
             return {
-                "verdict": response.text.strip()
+                "verdict": response.text.strip(),
+                "judge": {"latency_ms": round((time.perf_counter() - start) * 1000, 1), **response_usage(response)}
             }
         except Exception as e:
-            print(f"Error in Judge agent: {str(e)}")
+            logger.error(f"Error in Judge agent: {str(e)}")
             return {
                 "verdict": "Error in final decision"
             }
@@ -93,32 +174,181 @@ class JudgeAgent(Agent):
 class AgentManager:
     def __init__(self):
         self.agents: List[Agent] = []
+        # Names of experts whose knowledge base is still warming up; they sit out until marked ready
+        self.warming_up: set = set()
         self.judge: Optional[JudgeAgent] = None
         self.total_weight: float = 0.0
+        # google_agents.AdkCouncilEngine serving council mode "adk", if enabled
+        self.adk_engine = None
     
-    def add_agent(self, agent: Agent):
+    def add_agent(self, agent: Agent, ready: bool = True):
         self.agents.append(agent)
+        if not ready:
+            self.warming_up.add(agent.config.name)
         self.total_weight += agent.config.weight
     
     def set_judge(self, judge: JudgeAgent):
         self.judge = judge
     
-    async def analyze_prompt(self, prompt: str) -> Dict:
+    def set_adk_engine(self, engine):
+        self.adk_engine = engine
+    
+    def mark_ready(self, name: str):
+        self.warming_up.discard(name)
+    
+    def ready_agents(self) -> List[Agent]:
+        return [agent for agent in self.agents if agent.config.name not in self.warming_up]
+    
+    def readiness(self) -> Dict[str, str]:
+        """State of every council member: "ready" or "warming_up"."""
+        states = {agent.config.name: "warming_up" if agent.config.name in self.warming_up else "ready"
+                  for agent in self.agents}
+        if self.judge:
+            states[self.judge.config.name] = "ready"
+        return states
+    
+    def select_mode(self, prompt: str, mode: Optional[str] = None) -> str:
         """
-        Get evaluations from all agents and have the judge make a final decision.
+        Pick the council mode for a request: the given mode (replay candidates) or config.COUNCIL_MODE.
+        Prompts the pre-screen flags as high risk get the full fanout council instead of single_call.
+        """
+        mode = mode or config.COUNCIL_MODE
+        if mode not in COUNCIL_MODES:
+            raise ValueError(f"Unknown council mode: {mode}. Available: {list(COUNCIL_MODES)}")
+        if mode == "single_call" and prescreen_risk_tier(prompt) == "high":
+            return "fanout"
+        return mode
+    
+    async def analyze_prompt(self, prompt: str, mode: Optional[str] = None) -> Dict:
+        """
+        Run the council in the mode picked by select_mode.
         Returns a dict with the final verdict.
         """
-        if not self.agents or not self.judge:
+        if not self.ready_agents() or not self.judge:
             return {"verdict": "No agents available"}
         
-        # Get evaluations from all agents
-        tasks = [agent.analyze_prompt(prompt) for agent in self.agents]
+        mode = self.select_mode(prompt, mode)
+        if mode == "single_call":
+            try:
+                return await self.analyze_prompt_single_call(prompt)
+            except Exception as e:
+                logger.warning(f"Single call council failed, falling back to fanout: {str(e)}")
+        elif mode == "adk":
+            if self.adk_engine is None:
+                logger.warning("ADK council engine not enabled, falling back to fanout")
+            else:
+                try:
+                    return await self.analyze_prompt_adk(prompt)
+                except Exception as e:
+                    logger.warning(f"ADK council failed, falling back to fanout: {str(e)}")
+        return await self.analyze_prompt_fanout(prompt)
+    
+    async def analyze_prompt_adk(self, prompt: str) -> Dict:
+        """
+        Run the council on the ADK engine: the judge agent calls the ready experts as tools.
+        RAG context is retrieved up front in one shared search, as in fanout mode.
+        """
+        agents = self.ready_agents()
+        rag_contexts = await self.retrieve_rag_contexts(prompt, agents)
+        return await self.adk_engine.evaluate(prompt, agents, rag_contexts)
+    
+    async def analyze_prompt_fanout(self, prompt: str) -> Dict:
+        """
+        Get evaluations from all agents and have the judge make a final decision.
+        Returns a dict with the final verdict.
+        """
+        # Get evaluations from all agents that are ready; experts still warming up sit this one out
+        agents = self.ready_agents()
+        if self.warming_up:
+            logger.info(f"Running council without experts still warming up: {sorted(self.warming_up)}")
+        rag_contexts = await self.retrieve_rag_contexts(prompt, agents)
+        tasks = [agent.analyze_prompt(prompt, rag_contexts.get(agent.config.name)) for agent in agents]
         evaluations = await asyncio.gather(*tasks)
         
-        # Log each expert's evaluation
+        # Full evaluations go to the audit sink; only debug logging keeps them on the request path
         for eval in evaluations:
-            logger.info(f"Expert {eval['agent_name']} evaluation:\n{eval['evaluation']}")
+            logger.debug(f"Expert {eval['agent_name']} evaluation:\n{eval['evaluation']}")
         
         # Have the judge make the final decision
         final_decision = await self.judge.make_final_decision(evaluations, prompt)
-        return final_decision 
\ No newline at end of file
+        final_decision["mode"] = "fanout"
+        final_decision["evaluations"] = evaluations
+        return final_decision
+    
+    async def retrieve_rag_contexts(self, prompt: str, agents: List[Agent]) -> Dict[str, List[str]]:
+        """
+        Retrieve the RAG context of every agent that shares a knowledge store with one
+        prompt embedding and one search. Returns agent name -> formatted (compressed) passages.
+        """
+        views = [agent.rag for agent in agents if isinstance(agent.rag, rag.CorpusView)]
+        stores = {id(view.store) for view in views}
+        if len(stores) != 1:
+            return {}
+        names = [agent.config.name for agent in agents if isinstance(agent.rag, rag.CorpusView)]
+        try:
+            results = await asyncio.to_thread(views[0].store.context_views, prompt, views)
+        except Exception as e:
+            # The agents evaluate without context rather than each retrying the failed retrieval
+            logger.error(f"Shared RAG retrieval failed, evaluating without context: {str(e)}")
+            return {name: [] for name in names}
+        return dict(zip(names, results))
+    
+    async def analyze_prompt_single_call(self, prompt: str) -> Dict:
+        """
+        Evaluate the prompt with the persona of every ready expert in one generation. There is no
+        judge: the prompt is rejected as soon as any expert recommends rejecting it.
+        Raises ValueError if the response can't be parsed or an expert's verdict is missing.
+        """
+        weights = {agent.config.name: agent.config.weight for agent in self.ready_agents()}
+        council_prompt = get_prompt_for_single_call_council(list(weights))
+        
+        start = time.perf_counter()
+        chat = self.judge.model.start_chat(history=[])
+        response = await asyncio.to_thread(
+            chat.send_message,
+            f"{council_prompt}\n\nAnalyze this prompt: {prompt}",
+            generation_config=self.judge.budget.generation_config("single_call")
+        )
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        
+        evaluations = []
+        for item in _parse_json_array(response.text):
+            name = item.get("agent_name")
+            if name not in weights:
+                continue
+            verdict = parse_verdict(str(item.get("verdict", "")))
+            if verdict is None:
+                raise ValueError(f"Unclear verdict from expert {name}: {item.get('verdict')!r}")
+            evaluations.append({
+                "agent_name": name,
+                "verdict": verdict,
+                "evaluation": str(item.get("evaluation", "")).strip(),
+                "weight": weights[name]
+            })
+        missing = set(weights) - {eval["agent_name"] for eval in evaluations}
+        if missing:
+            raise ValueError(f"No verdict in response from experts: {sorted(missing)}")
+        
+        for eval in evaluations:
+            logger.debug(f"Expert {eval['agent_name']} verdict: {eval['verdict']}\n{eval['evaluation']}")
+        
+        voted_weight = sum(eval["weight"] for eval in evaluations)
+        rejecting = [eval for eval in evaluations if eval["verdict"] == "Not Permitted"]
+        risk_score = sum(eval["weight"] for eval in rejecting) / voted_weight
+        
+        if rejecting:
+            verdict = "Not Permitted"
+            explanation = "Concerns raised:\n" + "\n".join(
+                f"- {eval['agent_name']}: {eval['evaluation']}" for eval in rejecting
+            )
+        else:
+            verdict = "Permitted"
+            explanation = "No expert recommended rejecting the prompt."
+        return {
+            "verdict": f"{verdict}\n\n{explanation}",
+            "evaluations": evaluations,
+            "risk_score": risk_score,
+            "mode": "single_call",
+            # One generation serves every expert, so its cost is reported once for the council
+            "judge": {"latency_ms": latency_ms, **response_usage(response)}
+        }
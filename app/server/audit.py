@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import config
+from agents import parse_verdict
+
+logger = logging.getLogger(__name__)
+
+EXPERT_FIELDS = ("agent_name", "verdict", "latency_ms", "prompt_tokens", "output_tokens", "evaluation", "error")
+
+def council_record(council_decision: Dict, coalesced: bool = False, **fields) -> Dict:
+    """
+    Structured audit record of a council decision, with per-expert details and total token spend.
+    A coalesced decision was shared with the request that ran it, whose record carries the tokens.
+    """
+    judge = {} if coalesced else council_decision.get("judge", {})
+    experts = [{key: eval.get(key) for key in EXPERT_FIELDS} for eval in council_decision.get("evaluations", [])]
+    for expert in experts:
+        # Fanout experts answer in free text, so their verdict is read off the evaluation
+        if expert["verdict"] is None and expert["evaluation"]:
+            expert["verdict"] = parse_verdict(expert["evaluation"])
+        if coalesced:
+            expert["prompt_tokens"] = expert["output_tokens"] = 0
+    return dict(
+        fields,
+        timestamp=time.time(),
+        mode=council_decision.get("mode"),
+        coalesced=coalesced,
+        verdict=council_decision["verdict"],
+        permitted="Not Permitted" not in council_decision["verdict"],
+        prompt_tokens=sum(e["prompt_tokens"] or 0 for e in experts) + (judge.get("prompt_tokens") or 0),
+        output_tokens=sum(e["output_tokens"] or 0 for e in experts) + (judge.get("output_tokens") or 0),
+        experts=experts,
+    )
+
+class JsonlAuditWriter:
+    """Appends one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_batch(self, records: List[Dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def close(self):
+        pass
+
+class SqliteAuditWriter:
+    """One row per council evaluation; per-expert details are kept as a JSON column."""
+
+    COLUMNS = ("request_id", "timestamp", "client_id", "priority", "mode", "coalesced", "prompt", "verdict",
+               "permitted", "council_latency_ms", "prompt_tokens", "output_tokens", "experts")
+
+    def __init__(self, path: str):
+        # Only the writer thread touches the connection
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS council_audit ("
+            "request_id TEXT, timestamp REAL, client_id TEXT, priority TEXT, mode TEXT, coalesced INTEGER, "
+            "prompt TEXT, verdict TEXT, permitted INTEGER, council_latency_ms REAL, prompt_tokens INTEGER, "
+            "output_tokens INTEGER, experts TEXT)"
+        )
+        # Audit databases written before coalesced requests were marked
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(council_audit)")}
+        if "coalesced" not in columns:
+            self.connection.execute("ALTER TABLE council_audit ADD COLUMN coalesced INTEGER")
+        self.connection.commit()
+
+    def write_batch(self, records: List[Dict]):
+        rows = [
+            tuple(json.dumps(record.get(column)) if column == "experts" else record.get(column)
+                  for column in self.COLUMNS)
+            for record in records
+        ]
+        self.connection.executemany(
+            f"INSERT INTO council_audit ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            rows
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+class ParquetAuditWriter:
+    """Writes every batch as its own Parquet file in a directory (needs pyarrow)."""
+
+    def __init__(self, directory: str):
+        import pyarrow  # noqa: F401 - fail at startup rather than on the first batch
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write_batch(self, records: List[Dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        rows = [dict(record, experts=json.dumps(record.get("experts"))) for record in records]
+        path = os.path.join(self.directory, f"audit-{time.time_ns()}.parquet")
+        pq.write_table(pa.Table.from_pylist(rows), path)
+
+    def close(self):
+        pass
+
+AUDIT_WRITERS = {
+    "jsonl": JsonlAuditWriter,
+    "sqlite": SqliteAuditWriter,
+    "parquet": ParquetAuditWriter,
+}
+
+class AuditSink:
+    """
+    Non-blocking audit trail. record() only enqueues; a background thread writes records
+    in batches. When the queue is full, new records are dropped and counted rather than
+    slowing down the request path.
+    """
+
+    def __init__(self, writer, max_queue: int = config.AUDIT_MAX_QUEUE, batch_size: int = config.AUDIT_BATCH_SIZE,
+                 flush_interval: float = config.AUDIT_FLUSH_INTERVAL_S):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def record(self, record: Dict):
+        try:
+            self._queue.put_nowait(record)
+            self.stats["recorded"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _drain(self, block: bool) -> List[Dict]:
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[Dict]):
+        try:
+            self.writer.write_batch(batch)
+            self.stats["written"] += len(batch)
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            logger.error(f"Failed to write {len(batch)} audit records: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+        # Flush what is left on shutdown
+        while batch := self._drain(block=False):
+            self._write(batch)
+        self.writer.close()
+
+    def close(self, timeout: float = 10.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats, queued=self._queue.qsize())
+
+def create_audit_sink(kind: Optional[str] = config.AUDIT_SINK,
+                      path: Optional[str] = config.AUDIT_PATH) -> Optional[AuditSink]:
+    """The configured audit sink, started, or None if auditing is disabled."""
+    if not kind:
+        return None
+    if kind not in AUDIT_WRITERS:
+        raise ValueError(f"Unknown audit sink: {kind}. Available: {list(AUDIT_WRITERS)}")
+    return AuditSink(AUDIT_WRITERS[kind](path or config.AUDIT_DEFAULT_PATHS[kind])).start()
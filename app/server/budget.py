@@ -0,0 +1,160 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def response_usage(response) -> Dict:
+    """Token counts of a Gemini response, when the SDK reports them."""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+    }
+
+class TokenCounter:
+    """
+    Counts Gemini tokens without a network round trip. Uses the local Gemini tokenizer from
+    google-genai[local-tokenizer] when it can be loaded, otherwise characters divided by a chars-per-token ratio
+    that is calibrated against the prompt_token_count Gemini reports for every call.
+    """
+
+    def __init__(self, model_name: str = config.GEMINI_MODEL_NAME, chars_per_token: float = 4.0):
+        self.model_name = model_name
+        self.chars_per_token = chars_per_token
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._tokenizer_loaded:
+            with self._lock:
+                if not self._tokenizer_loaded:
+                    try:
+                        from google.genai.local_tokenizer import LocalTokenizer
+                        self._tokenizer = LocalTokenizer(model_name=self.model_name)
+                    except Exception as e:
+                        logger.info(f"Local Gemini tokenizer unavailable, estimating token counts: {str(e)}")
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            try:
+                return self.tokenizer.count_tokens(text).total_tokens
+            except Exception:
+                pass
+        return max(1, round(len(text) / self.chars_per_token))
+
+    def observe(self, text: str, prompt_tokens: Optional[int]):
+        """Calibrate the estimate with the token count Gemini reported for text."""
+        if prompt_tokens and self.tokenizer is None and len(text) > 200:
+            self.chars_per_token = 0.9 * self.chars_per_token + 0.1 * (len(text) / prompt_tokens)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to roughly max_tokens, at a word boundary."""
+        if self.count(text) <= max_tokens:
+            return text
+        cut = text[:int(max_tokens * self.chars_per_token)]
+        while cut and self.count(cut) > max_tokens:
+            cut = cut[:int(len(cut) * 0.9)]
+        return cut.rsplit(" ", 1)[0] + " ..."
+
+class TokenBudget:
+    """
+    Token limits for every stage of a request, from config.TOKEN_BUDGET. Output limits become
+    max_output_tokens on the Gemini calls; input limits are enforced by trimming what is
+    optional (RAG context, older chat history) and never the prompt under review.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, counter: Optional[TokenCounter] = None):
+        self.limits = dict(config.TOKEN_BUDGET, **(limits or {}))
+        self.counter = counter or TokenCounter()
+
+    def generation_config(self, stage: str, temperature: Optional[float] = None) -> Dict:
+        generation_config = {"max_output_tokens": self.limits[f"{stage}_output"]}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        return generation_config
+
+    def answer_generation_config(self, max_tokens: Optional[int], temperature: Optional[float]) -> Dict:
+        """The client's max_tokens, capped by the answer budget."""
+        limit = self.limits["answer_output"]
+        return {
+            "max_output_tokens": min(max_tokens, limit) if max_tokens else limit,
+            "temperature": temperature,
+        }
+
+    def output_words(self, stage: str) -> int:
+        """Word count to ask for, so answers end well before the hard output limit."""
+        return int(self.limits[f"{stage}_output"] * 0.6)
+
+    def fit_context(self, fixed_text: str, chunks: List[str]) -> Tuple[List[str], int]:
+        """
+        Keep the best ranked chunks that fit in the expert input budget next to fixed_text
+        (system prompt and prompt under review). Returns the chunks and how many were dropped.
+        """
+        available = self.limits["expert_input"] - self.counter.count(fixed_text)
+        kept = []
+        for chunk in chunks:
+            tokens = self.counter.count(chunk)
+            if tokens <= available:
+                kept.append(chunk)
+                available -= tokens
+            elif not kept and available > 50:
+                # The best chunk alone is too long: keep as much of it as fits
+                kept.append(self.counter.truncate(chunk, available))
+                available = 0
+            else:
+                break
+        return kept, len(chunks) - len(kept)
+
+    def fit_history(self, messages: List[Dict], prompt: str) -> List[Dict]:
+        """
+        Keep the most recent chat history turns that fit in the chat input budget. Gemini wants
+        turns that alternate from a user turn to a model turn before the prompt, so consecutive
+        messages of one role are merged into one turn and a trailing user turn is dropped.
+        """
+        turns = []
+        for message in messages:
+            if turns and turns[-1]["role"] == message["role"]:
+                turns[-1]["parts"].extend(message["parts"])
+            else:
+                turns.append({"role": message["role"], "parts": list(message["parts"])})
+        if turns and turns[-1]["role"] == "user":
+            turns.pop()
+        available = self.limits["chat_input"] - self.counter.count(prompt)
+        kept = []
+        for turn in reversed(turns):
+            tokens = sum(self.counter.count(part) for part in turn["parts"])
+            if tokens > available:
+                break
+            kept.insert(0, turn)
+            available -= tokens
+        if kept and kept[0]["role"] != "user":
+            kept.pop(0)
+        return kept
+
+def budget_report(council_decision: Dict, answer_usage: Optional[Dict], budget: "TokenBudget") -> Dict:
+    """Per-request token use next to the limits it ran under."""
+    evaluations = council_decision.get("evaluations", [])
+    judge = council_decision.get("judge", {})
+    report = {
+        "council": {
+            "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in evaluations) + (judge.get("prompt_tokens") or 0),
+            "output_tokens": sum(e.get("output_tokens") or 0 for e in evaluations) + (judge.get("output_tokens") or 0),
+            "max_expert_output_tokens": max((e.get("output_tokens") or 0 for e in evaluations), default=0),
+            "expert_output_limit": budget.limits["expert_output"],
+            "rag_chunks_dropped": sum(e.get("rag_chunks_dropped", 0) for e in evaluations),
+        },
+    }
+    if answer_usage is not None:
+        report["answer"] = answer_usage
+    return report
+
+default_budget = TokenBudget()
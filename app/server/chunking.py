@@ -0,0 +1,159 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import config
+
+# Lines that open a new section in the statute and textbook corpora, e.g.
+# "Section 12", "§ 18.2-152.4", "Chapter 3", "Article IV" or "2.1 Definitions". Numbered titles need a
+# multi-level number and a short title-case title, so enumerated clauses ("1. Any person who..."),
+# page headers ("12 Introduction to Psychology") and years ("2016 Basic...") don't count.
+DEFAULT_HEADING_PATTERN = (
+    r"^(?:(?i:section|sec\.|§|article|chapter|part|title)\s*[0-9IVXLCivxlc][\w.\-()]*"
+    r"|[0-9]{1,3}(?:\.[0-9]+)+\.?\s+[A-Z][\w'\-]*"
+    r"(?:\s+(?:(?:a|an|and|for|in|of|on|or|the|to|with)\s+)*[A-Z][\w'\-]*){0,7})$"
+)
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+")
+
+@dataclass
+class ChunkingConfig:
+    # all-MiniLM-L6-v2's max_seq_length of 256 less [CLS] and [SEP], longer chunks would be truncated when embedded
+    max_tokens: int = 254
+    # Trailing paragraphs carried into the next chunk, 0 keeps passages disjoint
+    overlap_tokens: int = 0
+    heading_pattern: str = DEFAULT_HEADING_PATTERN
+    # Start a new chunk at every page break instead of letting paragraphs flow across pages
+    split_on_pages: bool = False
+
+    @classmethod
+    def for_corpus(cls, path: str) -> "ChunkingConfig":
+        """Chunking settings for a corpus, from config.CHUNKING_BY_CORPUS."""
+        return cls(**config.CHUNKING_BY_CORPUS.get(path, {}))
+
+@dataclass
+class Chunk:
+    text: str
+    page: int  # 1-based page the chunk starts on
+    end_page: int
+    section: Optional[str] = None
+    num_tokens: int = 0
+    doc_id: Optional[str] = None
+
+    @property
+    def reference(self) -> str:
+        pages = f"p. {self.page}" if self.page == self.end_page else f"pp. {self.page}-{self.end_page}"
+        return f"{self.section}, {pages}" if self.section else pages
+
+@dataclass
+class _Paragraph:
+    text: str
+    page: int
+    num_tokens: int
+
+class StructureAwareChunker:
+    """
+    Packs whole paragraphs into chunks of at most max_tokens tokenizer tokens.
+    A heading always starts a new chunk and becomes the section of the chunks after it;
+    paragraphs that are too long on their own are split on sentence, then word, boundaries.
+    """
+
+    def __init__(self, chunking_config: ChunkingConfig, count_tokens: Callable[[str], int]):
+        self.config = chunking_config
+        self.count_tokens = count_tokens
+        self.heading = re.compile(chunking_config.heading_pattern)
+
+    def chunk_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Chunk]:
+        """Chunk (page number, page text) pairs in page order."""
+        current: List[_Paragraph] = []
+        section = None
+        for page_number, page_text in pages:
+            if self.config.split_on_pages and current:
+                yield self._make_chunk(current, section)
+                current = []
+            for block in PARAGRAPH_SPLIT.split(page_text):
+                for paragraph, is_heading in self._split_headings(block):
+                    if is_heading:
+                        if current:
+                            yield self._make_chunk(current, section)
+                            current = []
+                        section = paragraph
+                    for piece in self._fit(paragraph):
+                        tokens = self.count_tokens(piece)
+                        if current and sum(p.num_tokens for p in current) + tokens > self.config.max_tokens:
+                            yield self._make_chunk(current, section)
+                            # The carried overlap and the next piece together still fit in max_tokens
+                            current = self._overlap(current, self.config.max_tokens - tokens)
+                        current.append(_Paragraph(piece, page_number, tokens))
+        if current:
+            yield self._make_chunk(current, section)
+
+    def _split_headings(self, block: str) -> Iterator[Tuple[str, bool]]:
+        """Split a block on heading lines, yielding (text, is_heading)."""
+        lines = [line.strip() for line in block.splitlines() if line.strip()]
+        body = []
+        for i, line in enumerate(lines):
+            # A heading ends at its line; one continued in lowercase on the next line is wrapped body text
+            continued = i + 1 < len(lines) and lines[i + 1][0].islower()
+            if self.heading.match(line) and not continued:
+                if body:
+                    yield " ".join(body), False
+                    body = []
+                yield line, True
+            else:
+                body.append(line)
+        if body:
+            yield " ".join(body), False
+
+    def _fit(self, paragraph: str) -> List[str]:
+        """Split a paragraph into pieces that each fit in max_tokens."""
+        if self.count_tokens(paragraph) <= self.config.max_tokens:
+            return [paragraph]
+        # Token counts are added up per unit rather than recounted for the growing piece
+        pieces, current, current_tokens = [], [], 0
+        for unit, unit_tokens in self._units(paragraph):
+            if current and current_tokens + unit_tokens > self.config.max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def _units(self, paragraph: str) -> Iterator[Tuple[str, int]]:
+        """Sentences, or the words of sentences longer than max_tokens, with their token counts."""
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            tokens = self.count_tokens(sentence)
+            if tokens <= self.config.max_tokens:
+                yield sentence, tokens
+            else:
+                for word in sentence.split():
+                    yield word, self.count_tokens(word)
+
+    def _overlap(self, paragraphs: List[_Paragraph], room: int) -> List[_Paragraph]:
+        """Trailing paragraphs to carry into the next chunk, at most overlap_tokens and room tokens."""
+        limit = min(self.config.overlap_tokens, room)
+        carried, tokens = [], 0
+        for paragraph in reversed(paragraphs):
+            if tokens + paragraph.num_tokens > limit:
+                break
+            carried.insert(0, paragraph)
+            tokens += paragraph.num_tokens
+        return carried
+
+    def _make_chunk(self, paragraphs: List[_Paragraph], section: Optional[str]) -> Chunk:
+        return Chunk(
+            text="\n".join(p.text for p in paragraphs),
+            page=paragraphs[0].page,
+            end_page=paragraphs[-1].page,
+            section=section,
+            num_tokens=sum(p.num_tokens for p in paragraphs)
+        )
+
+def tokenizer_token_counter(tokenizer) -> Callable[[str], int]:
+    """Count tokens with a Hugging Face tokenizer, e.g. SentenceTransformer.tokenizer."""
+    def count_tokens(text: str) -> int:
+        # Special tokens are left out since chunks are counted per paragraph; max_tokens leaves room for them
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return count_tokens
@@ -0,0 +1,94 @@
+import re
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+import config
+from chunking import Chunk, SENTENCE_SPLIT
+from retrieval_cache import LRUCache
+
+LINE_SPLIT = re.compile(r"\n+")
+
+def split_sentences(text: str, min_chars: int) -> List[str]:
+    """Sentences of a chunk; fragments shorter than min_chars are merged into the next sentence."""
+    sentences, pending = [], ""
+    for line in LINE_SPLIT.split(text):
+        for sentence in SENTENCE_SPLIT.split(line.strip()):
+            sentence = f"{pending} {sentence}".strip() if pending else sentence.strip()
+            if len(sentence) < min_chars:
+                pending = sentence
+                continue
+            sentences.append(sentence)
+            pending = ""
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+class ExtractiveCompressor:
+    """
+    Shrinks retrieved chunks to the sentences most similar to the prompt, scored by cosine
+    similarity of their embeddings with the prompt embedding, up to max_tokens. Kept sentences
+    stay under their chunk's page reference, in document order, with gaps marked by "...".
+    Sentence embeddings are cached, so chunks that are retrieved often are embedded once.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], count_tokens: Callable[[str], int],
+                 max_tokens: int = config.RAG_COMPRESSION["max_tokens"],
+                 min_sentence_chars: int = config.RAG_COMPRESSION["min_sentence_chars"],
+                 cache_size: int = config.RAG_COMPRESSION["sentence_cache_size"]):
+        self.encode = encode
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.min_sentence_chars = min_sentence_chars
+        self.cache = LRUCache(cache_size, sizeof=lambda vector: vector.nbytes)
+
+    def _embed(self, sentences: List[str]) -> np.ndarray:
+        vectors = [self.cache.get(sentence) for sentence in sentences]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = np.asarray(self.encode([sentences[i] for i in missing]), dtype="float32")
+            for i, vector in zip(missing, encoded):
+                vector = vector / (np.linalg.norm(vector) or 1.0)
+                self.cache.put(sentences[i], vector)
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    def select(self, prompt_vec: np.ndarray, chunks: List[Chunk], max_tokens: int = None) -> List[List[Tuple[int, str]]]:
+        """Per chunk, the (position, sentence) pairs kept, in document order."""
+        max_tokens = max_tokens or self.max_tokens
+        candidates = [
+            (chunk_index, position, sentence)
+            for chunk_index, chunk in enumerate(chunks)
+            for position, sentence in enumerate(split_sentences(chunk.text, self.min_sentence_chars))
+        ]
+        kept = [[] for _ in chunks]
+        if not candidates:
+            return kept
+        query = np.asarray(prompt_vec, dtype="float32").reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._embed([sentence for _, _, sentence in candidates]) @ query
+
+        used = 0
+        for i in np.argsort(-scores):
+            chunk_index, position, sentence = candidates[i]
+            tokens = self.count_tokens(sentence)
+            if used + tokens > max_tokens:
+                if used:
+                    continue
+                # The best sentence alone is over budget: keep its start rather than nothing
+                sentence = sentence[:max_tokens * 4]
+            kept[chunk_index].append((position, sentence))
+            used += tokens
+        return [sorted(sentences) for sentences in kept]
+
+    def compress(self, prompt_vec: np.ndarray, chunks: List[Chunk], max_tokens: int = None) -> List[str]:
+        """Formatted context like rag.format_rag_context, keeping only the selected sentences."""
+        context = []
+        for chunk, sentences in zip(chunks, self.select(prompt_vec, chunks, max_tokens)):
+            if not sentences:
+                continue
+            text = sentences[0][1]
+            for (previous, _), (position, sentence) in zip(sentences, sentences[1:]):
+                text += (" " if position == previous + 1 else " ... ") + sentence
+            context.append(f"[{chunk.reference}]\n{text}")
+        return context
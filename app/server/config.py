@@ -1,2 +1,152 @@
+import os
 
-GEMINI_MODEL_NAME = 'gemini-1.5-flash'
\ No newline at end of file
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+
+# Council execution mode, set by the server only: "fanout" runs one call per expert plus a judge call,
+# "single_call" packs every expert persona into one structured generation, "adk" needs ADK_COUNCIL_ENABLED.
+# Prompts the keyword pre-screen flags as high risk always get the full fanout council instead of single_call.
+COUNCIL_MODE = os.getenv("COUNCIL_MODE", "fanout")
+
+# Token budget per request stage. *_output limits are passed as max_output_tokens; expert_input
+# bounds system prompt + RAG context + prompt (RAG context is trimmed to fit) and chat_input bounds
+# chat history + prompt (oldest history is dropped). answer_output caps the client's max_tokens.
+TOKEN_BUDGET = {
+    "expert_input": 2000,
+    "expert_output": 400,
+    "judge_output": 500,
+    "single_call_output": 2000,
+    "chat_input": 8000,
+    "answer_output": 2048,
+}
+
+# ADK council engine (google_agents.py, needs google-adk): adds council mode "adk", where an ADK
+# judge agent calls the experts as parallel tools. ADK reads GOOGLE_API_KEY from the environment.
+ADK_COUNCIL_ENABLED = os.getenv("ADK_COUNCIL_ENABLED", "").lower() in ("1", "true", "yes")
+ADK_APP_NAME = "prompt_security_council"
+# Finished per-request sessions kept in the ADK session service before eviction
+ADK_SESSION_POOL_SIZE = 256
+ADK_SESSION_TTL_S = 600.0
+
+# Embedding model for RAG, see embeddings.EMBEDDING_BACKENDS for the available backends.
+# The onnx backends need sentence-transformers[onnx] (ONNX Runtime and optimum), see requirements-onnx.txt.
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "torch"
+# Quantized ONNX weights shipped in the model repository, used by the "onnx-int8" backend
+EMBEDDING_ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+# RAG retrieval: "dense" is FAISS only, "hybrid" fuses FAISS and BM25 with reciprocal rank fusion
+RAG_RETRIEVAL_MODE = "hybrid"
+RAG_NUM_CHUNKS = 2
+# Number of candidates taken from each retriever before fusion / reranking
+RAG_CANDIDATE_POOL = 20
+# Optional local cross-encoder rerank of the fused candidates
+RAG_RERANK = False
+RAG_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Per corpus overrides of chunking.ChunkingConfig (max_tokens, overlap_tokens, heading_pattern, split_on_pages)
+CHUNKING_BY_CORPUS = {
+    "assets/basic-laws-book-2016.pdf": {"max_tokens": 254},
+    "assets/cybercrime-laws.pdf": {"max_tokens": 254},
+    "assets/Psych-101-Paul-Kleinman.pdf": {"max_tokens": 200, "overlap_tokens": 32},
+}
+
+# PDF ingestion: None uses one extraction worker process per core
+PDF_EXTRACTION_WORKERS = None
+PDF_PAGES_PER_TASK = 16
+RAG_EMBED_BATCH_SIZE = 64
+
+# FAISS index per corpus, see rag.build_faiss_index. Examples:
+#   {"type": "hnsw", "metric": "cosine", "params": {"M": 32, "ef_construction": 200, "ef_search": 64}}
+#   {"type": "ivfpq", "metric": "l2", "params": {"nlist": 256, "m": 8, "nbits": 8, "nprobe": 16}}
+RAG_INDEX = {"type": "flat", "metric": "l2", "params": {}}
+
+# Retrieval caches: prompt -> embedding, and (snapshot, view, prompt, k) -> chunk ids. 0 disables a cache.
+RAG_EMBEDDING_CACHE_SIZE = 4096
+RAG_RESULT_CACHE_SIZE = 16384
+
+# Extractive compression of RAG context: retrieve num_chunks chunks, then keep only the sentences
+# closest to the prompt embedding, up to max_tokens per expert, under their page references
+RAG_COMPRESSION = {
+    "enabled": True,
+    "num_chunks": 5,
+    "max_tokens": 350,
+    "min_sentence_chars": 20,
+    "sentence_cache_size": 50000,
+}
+
+# Unix socket of the retrieval sidecar (see retrieval_sidecar.py). When set, the server queries the
+# sidecar's shared knowledge store instead of loading its own, so uvicorn workers share one copy.
+RAG_SIDECAR_SOCKET = os.getenv("RAG_SIDECAR_SOCKET")
+
+# Admission control for /api/chat councils, see admission.AdmissionController
+ADMISSION_MAX_CONCURRENCY = 16
+ADMISSION_MAX_QUEUE = 256
+# Council latency assumed before any has been measured, seconds
+ADMISSION_INITIAL_SERVICE_TIME_S = 8.0
+# How long a request may wait for a council slot before it is rejected with 503, seconds
+ADMISSION_DEADLINE_S = {"interactive": 30.0, "batch": 300.0}
+# Reverse proxies whose X-Forwarded-For is trusted for the caller address admission is keyed on,
+# comma-separated IPs. Empty means the peer address is used as-is.
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+# Audit trail of council evaluations: "jsonl", "sqlite", "parquet" (needs pyarrow) or None to disable.
+# Off unless asked for, since records hold the raw prompts.
+AUDIT_SINK = os.getenv("AUDIT_SINK") or None
+# Where the sink writes; unset means the default for the sink kind
+AUDIT_PATH = os.getenv("AUDIT_PATH") or None
+AUDIT_DEFAULT_PATHS = {"jsonl": "council_audit.jsonl", "sqlite": "council_audit.db", "parquet": "council_audit_parquet"}
+AUDIT_MAX_QUEUE = 10000
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL_S = 1.0
+
+# Expert council members: weight in the vote and optional knowledge base PDF
+COUNCIL_EXPERTS = {
+    "lawyer": {
+        "weight": 1.0,
+        "rag_path": "assets/basic-laws-book-2016.pdf"  # Only lawyer gets RAG
+    },
+    "scientist": {
+        "weight": 0.9,
+        "rag_path": None
+    },
+    "medical_doctor": {
+        "weight": 1.0,
+        "rag_path": None
+    },
+    "psychiatrist": {
+        "weight": 0.9,
+        "rag_path": "assets/Psych-101-Paul-Kleinman.pdf"
+    },
+    "ethicist": {
+        "weight": 1.0,
+        "rag_path": None
+    },
+    "cybersecurity_expert": {
+        "weight": 1.0,
+        "rag_path": "assets/cybercrime-laws.pdf"  # Example RAG for cybersecurity
+    },
+    "child_safety_expert": {
+        "weight": 1.0,
+        "rag_path": None
+    }
+}
+
+# Shadow evaluation: a candidate council (JSON file, see replay.py) judges a sampled fraction of
+# live traffic in the background and is compared with the production verdicts
+SHADOW_COUNCIL_FILE = os.getenv("SHADOW_COUNCIL_FILE")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+SHADOW_MAX_CONCURRENCY = 2
+
+# On-demand profiling behind the admin endpoints, see profiling.py
+PROFILE_SAMPLE_INTERVAL_MS = 10
+# Sampling intervals the endpoints accept; below a millisecond the sampler itself dominates the profile
+PROFILE_MIN_INTERVAL_MS = 1
+PROFILE_MAX_INTERVAL_MS = 1000
+# A CPU profile that is never stopped ends on its own after this long, seconds
+PROFILE_MAX_SECONDS = 300
+# Stack depth recorded per allocation while tracemalloc is on; deeper is slower
+TRACEMALLOC_FRAMES = 16
+TRACEMALLOC_MAX_FRAMES = 128
+# Event loop lag is sampled every interval; the last window samples are kept
+LOOP_LAG_INTERVAL_S = 0.25
+LOOP_LAG_WINDOW = 1200
@@ -0,0 +1,43 @@
+import logging
+import threading
+from functools import lru_cache
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# "torch": float32 PyTorch (the baseline), "torch-int8": PyTorch with dynamically quantized Linear layers,
+# "onnx": ONNX Runtime, "onnx-int8": ONNX Runtime with the int8 weights shipped with the model
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+_load_lock = threading.Lock()
+
+def load_embedder(backend=config.EMBEDDING_BACKEND, model_name=config.EMBEDDING_MODEL_NAME):
+    """
+    Load the embedding model on the given backend, once per process.
+    Every backend returns a SentenceTransformer, so callers keep using encode() and tokenizer.
+    """
+    # Serialized so concurrent first calls from the warm-up and request threads load it once
+    with _load_lock:
+        return _load_embedder(backend, model_name)
+
+@lru_cache(maxsize=None)
+def _load_embedder(backend, model_name):
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Available: {list(EMBEDDING_BACKENDS)}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        model = SentenceTransformer(model_name)
+    elif backend == "torch-int8":
+        import torch
+        # Dynamic int8 quantization only runs on CPU
+        model = SentenceTransformer(model_name, device="cpu")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    else:
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                    model_kwargs={"file_name": config.EMBEDDING_ONNX_INT8_FILE})
+    logger.info(f"Loaded embedding model {model_name} on the {backend} backend")
+    return model
@@ -1,31 +1,29 @@
-import fitz  # PyMuPDF
+from chunking import ChunkingConfig, StructureAwareChunker, tokenizer_token_counter
+from pdf_extraction import iter_pdf_pages
 
 ###### 1. EXTRACT THE TEXT ######
+def extract_pdf_pages(path):
+    return iter_pdf_pages(path)
+
 def extract_pdf_text(path):
-    doc = fitz.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+    return "".join(text for _, text in extract_pdf_pages(path))
 
 
 ###### 2. CHUNK THE TEXT ######
-def chunk_text(text, max_length=1000, overlap=200):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + max_length
-        chunks.append(text[start:end])
-        start += max_length - overlap
-    return chunks
+def chunk_pages(pages, chunking_config=None):
+    chunker = StructureAwareChunker(chunking_config or ChunkingConfig(), tokenizer_token_counter(embedder.tokenizer))
+    return list(chunker.chunk_pages(pages))
+
+def chunk_text(text, chunking_config=None):
+    return chunk_pages([(1, text)], chunking_config)
 
 ###### 3. EMBEDD THE CHUNKS ######
-from sentence_transformers import SentenceTransformer
+from embeddings import load_embedder
 
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+embedder = load_embedder()
 
 def embed_chunks(chunks):
-    return embedder.encode(chunks)
+    return embedder.encode([chunk.text for chunk in chunks])
 
 
 ###### 4. STORE IN VECTOR DATA BASE ######
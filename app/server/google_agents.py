@@ -1,268 +1,160 @@
-from typing import Dict, List
-import google.generativeai as genai
-import google.auth
-from google.adk.agents import Agent
+"""
+Security council on Google's Agent Development Kit (ADK): the judge is an ADK agent that calls
+every expert as a tool. Selected per request with council mode "adk" once
+AgentManager.set_adk_engine() is given an AdkCouncilEngine (see config.ADK_COUNCIL_ENABLED).
+
+The expert tools reuse the council's agents.Agent objects, so they get the same prompts, RAG
+context and weights as the fanout council, and run concurrently: ADK executes the function calls
+of one model turn in parallel and the judge is instructed to call every expert in one turn.
+"""
+import contextvars
 import logging
-import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
 from google import adk
+from google.adk.agents import Agent as AdkAgent
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
+import config
+from budget import default_budget
+from agent_prompts import get_prompt_for_tool_calling_council_leader
+
 logger = logging.getLogger(__name__)
 
-def evaluate_law(prompt: str) -> Dict:
-    """Evaluates the prompt from a legal perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
-    """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a U.S. lawyer, evaluate this prompt for legal compliance and potential risks:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "lawyer"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Legal evaluation failed: {str(e)}",
-            "expert": "lawyer"
-        }
+# The request being evaluated, read by the expert tools: prompt, experts, RAG contexts and evaluations
+_current_request: contextvars.ContextVar[Dict] = contextvars.ContextVar("adk_council_request")
 
-def evaluate_science(prompt: str) -> Dict:
-    """Evaluates the prompt from a scientific perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
-    """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a scientist, evaluate this prompt for scientific safety and ethical concerns:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "scientist"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Scientific evaluation failed: {str(e)}",
-            "expert": "scientist"
-        }
+def _make_expert_tool(name: str):
+    """An async ADK tool that has expert name evaluate the prompt of the current request."""
+    async def evaluate() -> Dict:
+        request = _current_request.get()
+        agent = request["experts"].get(name)
+        if agent is None:
+            return {"status": "unavailable", "expert": name}
+        evaluation = await agent.analyze_prompt(request["prompt"], request["rag_contexts"].get(name))
+        request["evaluations"].append(evaluation)
+        if "error" in evaluation:
+            return {"status": "error", "error_message": evaluation["evaluation"], "expert": name}
+        return {"status": "success", "report": evaluation["evaluation"], "expert": name, "weight": evaluation["weight"]}
 
-def evaluate_medical(prompt: str) -> Dict:
-    """Evaluates the prompt from a medical perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
-    """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a medical doctor, evaluate this prompt for medical safety and health concerns:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "medical_doctor"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Medical evaluation failed: {str(e)}",
-            "expert": "medical_doctor"
-        }
+    evaluate.__name__ = evaluate.__qualname__ = f"evaluate_{name}"
+    evaluate.__doc__ = (
+        f"Evaluates the prompt under review from the perspective of the council's {name.replace('_', ' ')}.\n\n"
+        "Returns:\n    dict: Evaluation result with status and report"
+    )
+    return evaluate
 
-def evaluate_psychology(prompt: str) -> Dict:
-    """Evaluates the prompt from a psychological perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
+class SessionPool:
     """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a psychiatrist, evaluate this prompt for psychological safety and mental health concerns:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "psychiatrist"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Psychological evaluation failed: {str(e)}",
-            "expert": "psychiatrist"
-        }
-
-def evaluate_ethics(prompt: str) -> Dict:
-    """Evaluates the prompt from an ethical perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
+    One ADK session per evaluation, so no conversation history leaks between prompts. Finished
+    sessions stay in the session service for inspection until there are more than max_sessions
+    of them or they are older than ttl_s; sessions still in use are never evicted.
     """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As an ethicist, evaluate this prompt for ethical concerns and moral implications:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "ethicist"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Ethical evaluation failed: {str(e)}",
-            "expert": "ethicist"
-        }
 
-def evaluate_cybersecurity(prompt: str) -> Dict:
-    """Evaluates the prompt from a cybersecurity perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
-    """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a cybersecurity expert, evaluate this prompt for security risks and potential exploits:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "cybersecurity_expert"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Cybersecurity evaluation failed: {str(e)}",
-            "expert": "cybersecurity_expert"
-        }
+    def __init__(self, session_service, app_name: str, max_sessions: int = config.ADK_SESSION_POOL_SIZE,
+                 ttl_s: float = config.ADK_SESSION_TTL_S):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        # session id -> (user id, creation time), oldest first
+        self.sessions: OrderedDict = OrderedDict()
+        self.in_use: set = set()
+        self.stats = {"created": 0, "evicted": 0}
+
+    @asynccontextmanager
+    async def session(self, user_id: str):
+        session = await self.session_service.create_session(app_name=self.app_name, user_id=user_id)
+        self.sessions[session.id] = (user_id, time.monotonic())
+        self.in_use.add(session.id)
+        self.stats["created"] += 1
+        try:
+            yield session
+        finally:
+            self.in_use.discard(session.id)
+            await self.evict()
 
-def evaluate_child_safety(prompt: str) -> Dict:
-    """Evaluates the prompt from a child safety perspective.
-    
-    Args:
-        prompt (str): The prompt to evaluate
-        
-    Returns:
-        dict: Evaluation result with status and report
+    async def evict(self):
+        now = time.monotonic()
+        finished = [session_id for session_id in self.sessions if session_id not in self.in_use]
+        excess = len(self.sessions) - self.max_sessions
+        for session_id in finished:
+            user_id, created = self.sessions[session_id]
+            if excess <= 0 and now - created < self.ttl_s:
+                break
+            del self.sessions[session_id]
+            excess -= 1
+            self.stats["evicted"] += 1
+            await self.session_service.delete_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats, live=len(self.sessions), in_use=len(self.in_use))
+
+class AdkCouncilEngine:
+    """
+    Runs the council as an ADK judge agent with one tool per expert, on the async runner.
+    model is a Gemini model name or an ADK BaseLlm instance (benchmarks use a stub).
     """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        chat = model.start_chat()
-        response = chat.send_message(
-            "As a child safety expert, evaluate this prompt for risks to minors and child protection concerns:\n\n" + prompt
-        )
-        return {
-            "status": "success",
-            "report": response.text,
-            "expert": "child_safety_expert"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error_message": f"Child safety evaluation failed: {str(e)}",
-            "expert": "child_safety_expert"
-        }
 
-async def init_security_council():
-    """Initialize the security council with the judge agent and expert tools."""
-    try:
-        credentials, _ = google.auth.load_credentials_from_file("api_key.json")
-        if not credentials:
-            raise Exception("No credentials available")
-        
-        genai.configure(credentials=credentials)
-        
-        # Create the judge agent with all expert tools
-        judge_agent = Agent(
+    def __init__(self, expert_names: List[str], model=config.GEMINI_MODEL_NAME, app_name: str = config.ADK_APP_NAME):
+        self.judge = AdkAgent(
             name="security_council_judge",
-            model="gemini-1.5-flash",
+            model=model,
             description="Leader of the Prompt Security Council responsible for evaluating prompt safety",
-            instruction=(
-                "You are the Leader of the Prompt Security Council. Your role is to evaluate prompts "
-                "using expert tools and make final decisions on prompt safety. You must be thorough, "
-                "impartial, and protective of ethical standards. Your decision must be clear, justified, "
-                "and cautious. When in doubt, reject the prompt. Your output must start with either "
-                "'Permitted' or 'Not Permitted' followed by your explanation."
-            ),
-            tools=[
-                evaluate_law,
-                evaluate_science,
-                evaluate_medical,
-                evaluate_psychology,
-                evaluate_ethics,
-                evaluate_cybersecurity,
-                evaluate_child_safety
-            ]
-        )
-        
-        # 2. Set up a local (in-memory) session service & runner
-        app_name       = "my_app"
-        user_id        = "user123"
-        session_svc    = InMemorySessionService()
-        runner         = adk.Runner(
-            agent=judge_agent,
-            app_name=app_name,
-            session_service=session_svc
+            instruction=get_prompt_for_tool_calling_council_leader(),
+            tools=[_make_expert_tool(name) for name in expert_names],
+            generate_content_config=types.GenerateContentConfig(max_output_tokens=default_budget.limits["judge_output"])
         )
+        self.session_service = InMemorySessionService()
+        self.sessions = SessionPool(self.session_service, app_name)
+        self.runner = adk.Runner(agent=self.judge, app_name=app_name, session_service=self.session_service)
 
-        # 3. Create a new session
-        session = await session_svc.create_session(app_name=app_name, user_id=user_id)
+    async def evaluate(self, prompt: str, agents: List, rag_contexts: Optional[Dict[str, List[str]]] = None,
+                       user_id: str = "council") -> Dict:
+        """
+        Have the ADK judge evaluate a prompt with the given expert agents.
+        Returns the same shape as AgentManager.analyze_prompt_fanout, with mode "adk".
+        Raises ValueError unless the judge gave a verdict after calling every expert.
+        """
+        request = {
+            "prompt": prompt,
+            "experts": {agent.config.name: agent for agent in agents},
+            "rag_contexts": rag_contexts or {},
+            "evaluations": [],
+        }
+        token = _current_request.set(request)
+        start = time.perf_counter()
+        usage = {"prompt_tokens": 0, "output_tokens": 0}
+        verdict = None
+        try:
+            async with self.sessions.session(user_id) as session:
+                message = types.Content(role="user", parts=[types.Part(text=f"Analyze this prompt: {prompt}")])
+                async for event in self.runner.run_async(user_id=user_id, session_id=session.id, new_message=message):
+                    if event.usage_metadata:
+                        usage["prompt_tokens"] += event.usage_metadata.prompt_token_count or 0
+                        usage["output_tokens"] += event.usage_metadata.candidates_token_count or 0
+                    if event.is_final_response() and event.content and event.content.parts:
+                        verdict = "".join(part.text or "" for part in event.content.parts).strip()
+        finally:
+            _current_request.reset(token)
+        if not verdict:
+            raise ValueError("ADK council returned no verdict")
+        # The judge decides which tools to call; a verdict that skipped an expert is not a council verdict
+        skipped = set(request["experts"]) - {eval["agent_name"] for eval in request["evaluations"]}
+        if skipped:
+            raise ValueError(f"ADK judge gave a verdict without consulting {sorted(skipped)}")
 
-        # 4. Send a prompt
-        def call_agent(prompt: str):
-            content = types.Content(role="user", parts=[types.Part(text=prompt)])
-            events  = runner.run(
-                user_id=user_id,
-                session_id=session.id,
-                new_message=content
-            )
-            # The runner emits a stream of Events; extract the final LLM reply:
-            for event in events:
-                if event.is_final_response():
-                    return event.content.parts[0].text
+        for eval in request["evaluations"]:
+            logger.debug(f"Expert {eval['agent_name']} evaluation:\n{eval['evaluation']}")
 
-        # Example
-        reply = call_agent("Hello, what’s the weather in New York?")
-        print("Agent:", reply)
-        logger.info("Security council initialized successfully")
-        return judge_agent
-        
-    except Exception as e:
-        logger.error(f"Failed to initialize security council: {str(e)}")
-        raise 
\ No newline at end of file
+        return {
+            "verdict": verdict,
+            "evaluations": request["evaluations"],
+            "mode": "adk",
+            # Tokens of the judge's turns only, expert calls are reported per evaluation
+            "judge": {"latency_ms": round((time.perf_counter() - start) * 1000, 1), **usage}
+        }
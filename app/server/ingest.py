@@ -0,0 +1,63 @@
+"""
+Command line client for the knowledge store admin API of a running server.
+
+Documents are embedded and swapped in by the server itself, so updates need no restart.
+The admin token is read from the ADMIN_TOKEN environment variable.
+
+Usage:
+    python ingest.py list
+    python ingest.py add assets/new-statutes.pdf [--doc-id ID] [--meta key=value ...]
+    python ingest.py remove assets/old-statutes.pdf
+    python ingest.py sync
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+def call_api(server: str, method: str, path: str, body=None):
+    request = urllib.request.Request(
+        server.rstrip("/") + path,
+        method=method,
+        data=json.dumps(body).encode("utf-8") if body is not None else None,
+        headers={"Content-Type": "application/json", "X-Admin-Token": os.getenv("ADMIN_TOKEN", "")}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        sys.exit(f"Error {e.code}: {e.read().decode('utf-8', 'replace')}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="http://localhost:8000")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List the documents in the knowledge store")
+    add = subparsers.add_parser("add", help="Add or replace a document")
+    add.add_argument("path")
+    add.add_argument("--doc-id")
+    add.add_argument("--meta", nargs="*", default=[], help="Metadata as key=value pairs")
+    remove = subparsers.add_parser("remove", help="Remove a document")
+    remove.add_argument("doc_id")
+    subparsers.add_parser("sync", help="Mirror the server's assets directory")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        result = call_api(args.server, "GET", "/admin/corpus")
+    elif args.command == "add":
+        metadata = dict(pair.split("=", 1) for pair in args.meta) or None
+        result = call_api(args.server, "POST", "/admin/corpus",
+                          {"path": args.path, "doc_id": args.doc_id, "metadata": metadata})
+    elif args.command == "remove":
+        result = call_api(args.server, "DELETE", "/admin/corpus/" + urllib.parse.quote(args.doc_id))
+    else:
+        result = call_api(args.server, "POST", "/admin/corpus/sync")
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
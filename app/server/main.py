@@ -1,18 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from models import LLMRequest
+from models import LLMRequest, CorpusDocumentRequest
 from agents import AgentManager, Agent, JudgeAgent, AgentConfig
+from rag import KnowledgeStore
+from retrieval_sidecar import RemoteKnowledgeStore
+from admission import AdmissionController, Overloaded
+from singleflight import SingleFlight
+from budget import default_budget, budget_report, response_usage
+from audit import AuditSink, create_audit_sink, council_record
+from replay import CouncilCandidate, ShadowCouncil, build_council
+from profiling import (SamplingProfiler, HeapProfiler, LoopLagMonitor, executor_stats, process_memory,
+                       scan_objects, store_memory)
+import config
+import os
 from agent_prompts import get_prompt_for_council_member, get_prompt_for_council_leader, ADDED_PROMPT_DICT
 import logging
 import uuid
 import google.generativeai as genai
 import google.auth
 import asyncio
+import secrets
+import time
+from typing import Optional, Dict, List
 from contextlib import asynccontextmanager
 
 API_KEY_FILE = "api_key.json"
 # Configure the risk threshold (0.0 to 1.0)
 RISK_THRESHOLD = 0.7  # Reject prompts with risk score >= 0.7
+ASSETS_DIR = "assets"
+# Admin endpoints are disabled unless ADMIN_TOKEN is set; clients send it in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # Configure logging
 logging.basicConfig(
@@ -24,21 +42,45 @@ logger = logging.getLogger(__name__)
 
 # Global Gemini model instance
 gemini_model = None
+# Background task embedding the knowledge store corpora after startup
+warmup_task: Optional[asyncio.Task] = None
+# Structured record of every council evaluation, written off the request path
+audit_sink: Optional[AuditSink] = None
+# Candidate council judging sampled live traffic in the background, see config.SHADOW_COUNCIL_FILE
+shadow_council: Optional[ShadowCouncil] = None
+# Event loop lag, sampled for the whole life of the server
+loop_lag: Optional[LoopLagMonitor] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up server...")
-    global gemini_model
+    global gemini_model, warmup_task, audit_sink, shadow_council, loop_lag
+    loop_lag = LoopLagMonitor().start()
     gemini_model = init_gemini()
-    load_agents()  # Uncomment this to load the council of agents
-    logger.info("Server startup complete")
+    audit_sink = create_audit_sink()
+    # Load the tokenizer now rather than on the first request, off the event loop
+    await asyncio.to_thread(lambda: default_budget.counter.tokenizer)
+    # Agents are created right away; experts with a knowledge base join the council once it is embedded
+    rag_experts = load_agents()
+    if config.ADK_COUNCIL_ENABLED:
+        load_adk_engine()
+    shadow_council = load_shadow_council()
+    warmup_task = asyncio.create_task(warm_up_knowledge_store(rag_experts))
+    logger.info("Server startup complete, knowledge store warming up in the background")
     
     yield
     
     # Shutdown
     logger.info("Shutting down server...")
-    # Add any cleanup code here if needed
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if shadow_council:
+        await shadow_council.close()
+    await loop_lag.close()
+    if audit_sink:
+        # Flushes the records still queued
+        await asyncio.to_thread(audit_sink.close)
     logger.info("Server shutdown complete")
 
 app = FastAPI(lifespan=lifespan)
@@ -54,6 +96,15 @@ app.add_middleware(
 
 # Initialize agent manager
 agent_manager = AgentManager()
+# Bounds concurrent councils and queues / sheds the rest
+admission = AdmissionController()
+# Concurrent requests for the same prompt share one council evaluation
+council_flights = SingleFlight()
+# Shared knowledge store for every RAG-enabled expert, updated in place by the admin endpoints
+knowledge_store: Optional[KnowledgeStore] = None
+# Started and stopped on demand by the /admin/profile endpoints
+cpu_profiler = SamplingProfiler()
+heap_profiler = HeapProfiler()
 
 # Initialize Gemini model
 def init_gemini():
@@ -89,60 +140,140 @@ def load_agents():
     agent_manager.set_judge(judge)
     logger.info("Judge agent initialized")
     
-    # Create expert agents with their configurations
-    expert_configs = {
-        "lawyer": {
-            "weight": 1.0,
-            "rag_path": "assets/basic-laws-book-2016.pdf"  # Only lawyer gets RAG
-        },
-        "scientist": {
-            "weight": 0.9,
-            "rag_path": None
-        },
-        "medical_doctor": {
-            "weight": 1.0,
-            "rag_path": None
-        },
-        "psychiatrist": {
-            "weight": 0.9,
-            "rag_path": "assets/Psych-101-Paul-Kleinman.pdf"
-        },
-        "ethicist": {
-            "weight": 1.0,
-            "rag_path": None
-        },
-        "cybersecurity_expert": {
-            "weight": 1.0,
-            "rag_path": "assets/cybercrime-laws.pdf"  # Example RAG for cybersecurity
-        },
-        "child_safety_expert": {
-            "weight": 1.0,
-            "rag_path": None
-        }
-    }
+    # Every corpus goes into one shared knowledge store; each expert queries its own documents.
+    # The store is empty until warm_up_knowledge_store embeds the corpora in the background.
+    # With a retrieval sidecar, every worker queries the sidecar's store instead of building one.
+    global knowledge_store
+    if config.RAG_SIDECAR_SOCKET:
+        knowledge_store = RemoteKnowledgeStore(config.RAG_SIDECAR_SOCKET)
+        logger.info(f"Using retrieval sidecar at {config.RAG_SIDECAR_SOCKET}")
+    else:
+        knowledge_store = KnowledgeStore()
+    rag_experts: Dict[str, List[str]] = {}
     
-    for expert_type, config in expert_configs.items():
+    for expert_type, expert_config in config.COUNCIL_EXPERTS.items():
         try:
             expert_prompt = get_prompt_for_council_member(expert_type)
             agent_config = AgentConfig(
                 name=expert_type,
-                weight=config["weight"],
+                weight=expert_config["weight"],
                 system_prompt=expert_prompt,
                 api_key=credentials,
-                rag_path=config["rag_path"]
+                rag_path=expert_config["rag_path"]
             )
-            agent_manager.add_agent(Agent(agent_config, gemini_model))
-            logger.info(f"Added {expert_type} agent with weight {config['weight']}" + 
-                       (f" and RAG from {config['rag_path']}" if config['rag_path'] else ""))
+            has_rag = bool(expert_config["rag_path"]) and os.path.exists(expert_config["rag_path"])
+            agent_manager.add_agent(Agent(agent_config, gemini_model, knowledge_store), ready=not has_rag)
+            if has_rag:
+                rag_experts.setdefault(expert_config["rag_path"], []).append(expert_type)
+            logger.info(f"Added {expert_type} agent with weight {expert_config['weight']}" + 
+                       (f" and RAG from {expert_config['rag_path']}" if expert_config['rag_path'] else ""))
         except ValueError as e:
             logger.error(f"Failed to create {expert_type} agent: {str(e)}")
     
     logger.info(f"Total agents initialized: {len(agent_manager.agents) + 1} (including judge)")
+    return rag_experts
+
+def load_adk_engine():
+    """Serve council mode "adk" with the ADK engine; google-adk is only needed when it is enabled."""
+    try:
+        from google_agents import AdkCouncilEngine
+        agent_manager.set_adk_engine(AdkCouncilEngine([agent.config.name for agent in agent_manager.agents]))
+        logger.info("ADK council engine enabled")
+    except Exception as e:
+        logger.error(f"Failed to initialize the ADK council engine, mode adk will fall back to fanout: {str(e)}")
+
+def load_shadow_council() -> Optional[ShadowCouncil]:
+    """The shadow council from config.SHADOW_COUNCIL_FILE, sharing the production knowledge store."""
+    if not config.SHADOW_COUNCIL_FILE or config.SHADOW_SAMPLE_RATE <= 0:
+        return None
+    try:
+        candidate = CouncilCandidate.from_file(config.SHADOW_COUNCIL_FILE)
+        model = gemini_model if candidate.model == config.GEMINI_MODEL_NAME else genai.GenerativeModel(candidate.model)
+        manager = build_council(candidate, model, knowledge_store)
+        # Experts still warming up sit out of the shadow council too, as they do in production
+        manager.warming_up = agent_manager.warming_up
+        shadow = ShadowCouncil(candidate, manager, audit_sink=audit_sink)
+        logger.info(f"Shadowing {config.SHADOW_SAMPLE_RATE:.0%} of traffic with council {candidate.name}")
+        return shadow
+    except Exception as e:
+        logger.error(f"Failed to load shadow council from {config.SHADOW_COUNCIL_FILE}: {str(e)}")
+        return None
+
+async def warm_up_knowledge_store(rag_experts: Dict[str, List[str]]):
+    """
+    Load the embedding model and embed each corpus off the event loop. Every corpus is
+    published as soon as it is embedded and its experts join the council right away.
+    An expert whose corpus fails to load joins without RAG context.
+    """
+    if isinstance(knowledge_store, RemoteKnowledgeStore):
+        await wait_for_retrieval_sidecar(rag_experts)
+        return
+    try:
+        await asyncio.to_thread(lambda: knowledge_store.model)
+    except Exception as e:
+        logger.error(f"Failed to load the embedding model, RAG experts will run without context: {str(e)}")
+        for experts in rag_experts.values():
+            for expert in experts:
+                agent_manager.mark_ready(expert)
+        return
+    for path, experts in rag_experts.items():
+        try:
+            await asyncio.to_thread(knowledge_store.upsert_pdf, path)
+            logger.info(f"Knowledge base {path} ready for {', '.join(experts)}")
+        except Exception as e:
+            logger.error(f"Failed to load knowledge base {path}, {', '.join(experts)} will run without it: {str(e)}")
+        for expert in experts:
+            agent_manager.mark_ready(expert)
+    logger.info("Knowledge store warm-up complete")
+
+async def wait_for_retrieval_sidecar(rag_experts: Dict[str, List[str]], poll_seconds: float = 2.0):
+    """Mark experts ready as the sidecar publishes their corpora, or when its warm-up ends."""
+    pending = dict(rag_experts)
+    while pending:
+        try:
+            status = await asyncio.to_thread(knowledge_store.status)
+        except Exception as e:
+            logger.warning(f"Retrieval sidecar not reachable yet: {str(e)}")
+            await asyncio.sleep(poll_seconds)
+            continue
+        if status.get("error"):
+            logger.error(f"Retrieval sidecar warm-up failed, RAG experts run with what it has: {status['error']}")
+        for path in [path for path in pending if path in status["documents"] or not status["warming_up"]]:
+            for expert in pending.pop(path):
+                agent_manager.mark_ready(expert)
+        if pending:
+            await asyncio.sleep(poll_seconds)
+    logger.info("Retrieval sidecar knowledge store ready")
+
+def client_address(http_request: Request) -> str:
+    """Address of the caller, taken from X-Forwarded-For only when the peer is a trusted proxy."""
+    peer = http_request.client.host if http_request.client else "unknown"
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if forwarded and peer in config.TRUSTED_PROXIES:
+        # The proxy appends the address it saw, so the last entry is the only one a client can't forge
+        return forwarded.split(",")[-1].strip() or peer
+    return peer
+
+def audit_council_decision(request_id: str, client_id: str, request: LLMRequest, council_decision: Dict,
+                           latency_ms: float, coalesced: bool = False):
+    """Queue the structured audit record of a council evaluation."""
+    if audit_sink:
+        audit_sink.record(council_record(
+            council_decision,
+            coalesced=coalesced,
+            request_id=request_id,
+            client_id=client_id,
+            priority=request.priority,
+            prompt=request.prompt,
+            council_latency_ms=latency_ms
+        ))
 
 @app.post("/api/chat")
-async def chat(request: LLMRequest):
+async def chat(request: LLMRequest, http_request: Request):
     request_id = str(uuid.uuid4())[:8]
     logger.info(f"[{request_id}] Processing chat request")
+    # Fair scheduling is per caller address, which the caller can't choose the way it could a header
+    client_id = client_address(http_request)
     
     if not gemini_model:
         logger.error(f"[{request_id}] Gemini model not initialized")
@@ -151,14 +282,38 @@ async def chat(request: LLMRequest):
     try:
         # First, have the council evaluate the prompt
         logger.info(f"[{request_id}] Having council evaluate prompt")
-        council_decision = await agent_manager.analyze_prompt(request.prompt)
         
-        # Log the council's decision
-        logger.info(f"[{request_id}] Council decision:\n{council_decision['verdict']}")
+        async def evaluate():
+            async with admission.slot(client_id, request.priority):
+                return await agent_manager.analyze_prompt(request.prompt)
+        
+        # Duplicates of an in-flight prompt wait for its evaluation instead of taking a slot of their own.
+        # Only same-priority duplicates share a flight, so an interactive request never waits on a batch slot.
+        flight_key = (" ".join(request.prompt.split()), request.priority)
+        start = time.perf_counter()
+        try:
+            council_decision, evaluated = await council_flights.do(flight_key, evaluate)
+        except Overloaded as e:
+            logger.warning(f"[{request_id}] Shed {request.priority} request from {client_id}: {str(e)}")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server overloaded: {str(e)}",
+                headers={"Retry-After": str(max(1, round(e.retry_after)))}
+            )
+        
+        # The full decision and expert evaluations go to the audit sink, the log gets a one-line summary
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        permitted = "Not Permitted" not in council_decision["verdict"]
+        # Requests that shared another request's evaluation are audited without its token spend
+        audit_council_decision(request_id, client_id, request, council_decision, latency_ms, coalesced=not evaluated)
+        if shadow_council and evaluated:
+            shadow_council.maybe_evaluate(request_id, request.prompt, permitted)
+        logger.info(f"[{request_id}] Council decision ({council_decision.get('mode')}): "
+                    f"{'permitted' if permitted else 'not permitted'} in {latency_ms:.0f} ms")
         
         # Check if the prompt was permitted
-        if "Not Permitted" in council_decision["verdict"]:
-            logger.warning(f"[{request_id}] Council rejected prompt: {council_decision['verdict']}")
+        if not permitted:
+            logger.warning(f"[{request_id}] Council rejected prompt")
             raise HTTPException(
                 status_code=403,
                 detail={
@@ -169,27 +324,33 @@ async def chat(request: LLMRequest):
         
         # If permitted, proceed with the chat
         logger.info(f"[{request_id}] Council approved prompt, proceeding with chat")
-        chat = gemini_model.start_chat()
-        
-        # Convert chat history to Gemini format and send previous messages
-        for message in request.chat_history:
-            await asyncio.to_thread(
-                chat.send_message,
-                message.content
-            )
+        # Previous turns go in as history, the most recent ones that fit in the chat input budget
+        history = await asyncio.to_thread(default_budget.fit_history, [
+            {"role": "model" if message.role in ("assistant", "model") else "user", "parts": [message.content]}
+            for message in request.chat_history
+        ], request.prompt)
+        chat = gemini_model.start_chat(history=history)
+        generation_config = default_budget.answer_generation_config(request.max_tokens, request.temperature)
         
         # Send the current message and get response
         logger.info(f"[{request_id}] Sending prompt to Gemini: {request.prompt[:100]}...")
         response = await asyncio.to_thread(
             chat.send_message,
-            request.prompt
+            request.prompt,
+            generation_config=generation_config
         )
         
-        logger.info(f"[{request_id}] Received response from Gemini")
+        token_budget = budget_report(council_decision, dict(
+            response_usage(response),
+            max_output_tokens=generation_config["max_output_tokens"],
+            history_messages_dropped=len(request.chat_history) - sum(len(turn["parts"]) for turn in history)
+        ), default_budget)
+        logger.info(f"[{request_id}] Received response from Gemini, tokens: {token_budget}")
         return {
             "response": response.text,
             "status": "success",
-            "council_verdict": council_decision["verdict"]
+            "council_verdict": council_decision["verdict"],
+            "token_budget": token_budget
         }
     except HTTPException:
         raise
@@ -197,6 +358,202 @@ async def chat(request: LLMRequest):
         logger.error(f"[{request_id}] Error in chat processing: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the council can evaluate prompts, possibly with some experts still warming up."""
+    agents = agent_manager.readiness()
+    ready = gemini_model is not None and agent_manager.judge is not None and bool(agent_manager.ready_agents())
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "warming_up": bool(agent_manager.warming_up),
+        "agents": agents,
+    }
+    return body if ready else JSONResponse(status_code=503, content=body)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+def get_knowledge_store() -> KnowledgeStore:
+    if knowledge_store is None:
+        raise HTTPException(status_code=503, detail="Knowledge store not initialized")
+    return knowledge_store
+
+def _asset_path(path: str) -> str:
+    """Resolve a document path, which must point to a PDF inside the assets directory."""
+    assets = os.path.realpath(ASSETS_DIR)
+    resolved = os.path.realpath(path if os.path.isabs(path) else os.path.join(os.getcwd(), path))
+    if not resolved.startswith(assets + os.sep) or not resolved.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail=f"Documents must be PDFs inside {ASSETS_DIR}/")
+    if not os.path.exists(resolved):
+        raise HTTPException(status_code=404, detail=f"File not found: {path}")
+    return os.path.relpath(resolved)
+
+@app.get("/admin/corpus", dependencies=[Depends(require_admin)])
+async def list_corpus():
+    store = get_knowledge_store()
+    return {"version": store.version, "documents": store.documents}
+
+@app.post("/admin/corpus", dependencies=[Depends(require_admin)])
+async def upsert_corpus_document(request: CorpusDocumentRequest):
+    store = get_knowledge_store()
+    path = _asset_path(request.path)
+    logger.info(f"Upserting knowledge store document {request.doc_id or path}")
+    try:
+        doc_id = await asyncio.to_thread(store.upsert_pdf, path, request.doc_id, request.metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"doc_id": doc_id, "version": store.version}
+
+@app.delete("/admin/corpus/{doc_id:path}", dependencies=[Depends(require_admin)])
+async def remove_corpus_document(doc_id: str):
+    store = get_knowledge_store()
+    if not await asyncio.to_thread(store.remove_document, doc_id):
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    logger.info(f"Removed knowledge store document {doc_id}")
+    return {"doc_id": doc_id, "version": store.version}
+
+@app.post("/admin/corpus/sync", dependencies=[Depends(require_admin)])
+async def sync_corpus():
+    store = get_knowledge_store()
+    result = await asyncio.to_thread(store.sync_directory, ASSETS_DIR)
+    logger.info(f"Synced knowledge store with {ASSETS_DIR}/: {result}")
+    return dict(result, version=store.version)
+
+@app.get("/admin/admission", dependencies=[Depends(require_admin)])
+async def admission_stats():
+    stats = dict(admission.snapshot(), coalescing=dict(council_flights.stats, in_flight=council_flights.in_flight))
+    if agent_manager.adk_engine:
+        stats["adk_sessions"] = agent_manager.adk_engine.sessions.snapshot()
+    return stats
+
+@app.get("/admin/audit", dependencies=[Depends(require_admin)])
+async def audit_stats():
+    return audit_sink.snapshot() if audit_sink else {"enabled": False}
+
+@app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+async def shadow_stats():
+    return shadow_council.report() if shadow_council else {"enabled": False}
+
+@app.get("/admin/rag/cache", dependencies=[Depends(require_admin)])
+async def rag_cache_stats():
+    return get_knowledge_store().cache_stats()
+
+@app.get("/admin/runtime", dependencies=[Depends(require_admin)])
+async def runtime_stats():
+    return {
+        "event_loop_lag": loop_lag.snapshot() if loop_lag else None,
+        "executor": executor_stats(asyncio.get_running_loop()),
+        "asyncio_tasks": len(asyncio.all_tasks()),
+        "process": process_memory(),
+    }
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def memory_stats(objects: bool = False):
+    """
+    Memory per component. objects=true also walks the heap for the most common object types
+    and every loaded embedding / reranker model, which takes a while on a large heap.
+    """
+    stores, views = {}, {}
+    for agent in agent_manager.agents:
+        if agent.rag is not None:
+            stores[id(agent.rag.store)] = agent.rag.store
+            views.setdefault(id(agent.rag.store), {})[agent.config.name] = agent.rag
+    if knowledge_store is not None:
+        stores.setdefault(id(knowledge_store), knowledge_store)
+    memory = {
+        "process": process_memory(),
+        "knowledge_stores": [
+            await asyncio.to_thread(store_memory, store, views.get(store_id, {})) for store_id, store in stores.items()
+        ],
+        "queues": {
+            "audit": audit_sink.snapshot()["queued"] if audit_sink else None,
+            "admission": admission.snapshot(),
+            "coalesced_in_flight": council_flights.in_flight,
+        },
+        "token_counter_chars_per_token": round(default_budget.counter.chars_per_token, 3),
+    }
+    if agent_manager.adk_engine:
+        memory["adk_sessions"] = agent_manager.adk_engine.sessions.snapshot()
+    if objects:
+        memory["objects"] = await asyncio.to_thread(scan_objects)
+    return memory
+
+@app.post("/admin/profile/cpu/start", dependencies=[Depends(require_admin)])
+async def start_cpu_profile(interval_ms: float = Query(config.PROFILE_SAMPLE_INTERVAL_MS, ge=config.PROFILE_MIN_INTERVAL_MS,
+                                                      le=config.PROFILE_MAX_INTERVAL_MS),
+                            max_seconds: float = Query(config.PROFILE_MAX_SECONDS, gt=0, le=config.PROFILE_MAX_SECONDS)):
+    try:
+        cpu_profiler.start(interval_ms, max_seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return cpu_profiler.status()
+
+@app.post("/admin/profile/cpu/stop", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def stop_cpu_profile(include_idle: bool = False):
+    """Stop the CPU profile and return it as folded stacks, e.g. for flamegraph.pl or speedscope."""
+    try:
+        await asyncio.to_thread(cpu_profiler.stop)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return cpu_profiler.collapsed(include_idle)
+
+@app.get("/admin/profile/cpu", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def cpu_profile(seconds: float = Query(30.0, gt=0, le=config.PROFILE_MAX_SECONDS),
+                      interval_ms: float = Query(config.PROFILE_SAMPLE_INTERVAL_MS, ge=config.PROFILE_MIN_INTERVAL_MS,
+                                                 le=config.PROFILE_MAX_INTERVAL_MS),
+                      include_idle: bool = False):
+    """Profile for the given number of seconds, then return folded stacks."""
+    await start_cpu_profile(interval_ms, seconds)
+    await asyncio.sleep(seconds)
+    return await stop_cpu_profile(include_idle)
+
+@app.get("/admin/profile/cpu/status", dependencies=[Depends(require_admin)])
+async def cpu_profile_status():
+    return cpu_profiler.status()
+
+@app.post("/admin/profile/heap/start", dependencies=[Depends(require_admin)])
+async def start_heap_profile(frames: int = Query(config.TRACEMALLOC_FRAMES, ge=1, le=config.TRACEMALLOC_MAX_FRAMES)):
+    try:
+        heap_profiler.start(frames)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return heap_profiler.status()
+
+@app.post("/admin/profile/heap/snapshot", dependencies=[Depends(require_admin)])
+async def heap_snapshot(limit: int = Query(25, ge=1, le=1000), format: str = "json"):
+    """Take a tracemalloc snapshot: top allocation sites (json) or live allocations as folded stacks."""
+    try:
+        snapshot = await asyncio.to_thread(heap_profiler.snapshot)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse(await asyncio.to_thread(heap_profiler.collapsed, snapshot))
+    return await asyncio.to_thread(heap_profiler.report, snapshot, limit)
+
+@app.get("/admin/profile/heap/diff", dependencies=[Depends(require_admin)])
+async def heap_diff(limit: int = Query(25, ge=1, le=1000), format: str = "json"):
+    """Allocation growth between the last two snapshots."""
+    try:
+        if format == "folded":
+            return PlainTextResponse(await asyncio.to_thread(heap_profiler.collapsed_diff))
+        return await asyncio.to_thread(heap_profiler.diff, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/profile/heap/stop", dependencies=[Depends(require_admin)])
+async def stop_heap_profile():
+    try:
+        heap_profiler.stop()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return heap_profiler.status()
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting server on 0.0.0.0:8000")
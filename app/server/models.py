@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal
 
 class Message(BaseModel):
     role: str
@@ -9,4 +9,11 @@ class LLMRequest(BaseModel):
     prompt: str
     chat_history: Optional[List[Message]] = []
     temperature: Optional[float] = 0.7
-    max_tokens: Optional[int] = 1000 
\ No newline at end of file
+    max_tokens: Optional[int] = Field(1000, gt=0)
+    # Interactive requests are admitted before batch ones when the council is saturated
+    priority: Literal["interactive", "batch"] = "interactive"
+
+class CorpusDocumentRequest(BaseModel):
+    path: str
+    doc_id: Optional[str] = None
+    metadata: Optional[Dict[str, str]] = None
\ No newline at end of file
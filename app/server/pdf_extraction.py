@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+import config
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    # Runs in a worker process: each worker opens its own document handle
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return [(number + 1, doc[number].get_text()) for number in range(start, stop)]
+
+def page_count(pdf_path: str) -> int:
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def iter_pdf_pages(pdf_path: str, workers: int = None, pages_per_task: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, page text) pairs in page order.
+    Page ranges are extracted in parallel across a process pool, with at most two ranges
+    per worker in flight so memory stays bounded however large the document is.
+    """
+    workers = workers or config.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+    pages_per_task = pages_per_task or config.PDF_PAGES_PER_TASK
+    num_pages = page_count(pdf_path)
+    ranges = iter([(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)])
+
+    if workers <= 1 or num_pages <= pages_per_task:
+        for start, stop in ranges:
+            yield from _extract_page_range(pdf_path, start, stop)
+        return
+
+    # Spawned, not forked: extraction runs from the warm-up thread while torch threads hold locks
+    # that a forked child would inherit locked.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque(pool.submit(_extract_page_range, pdf_path, start, stop)
+                        for start, stop in islice(ranges, workers * 2))
+        while pending:
+            pages = pending.popleft().result()
+            for start, stop in islice(ranges, 1):
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+            yield from pages
+
+def batched(iterable, size: int):
+    """Group an iterable into lists of at most size items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,404 @@
+"""
+On-demand profiling of the running server, served by the /admin/profile/* endpoints in main.py.
+
+- CPU: SamplingProfiler samples the Python stack of every thread and returns the samples in the
+  collapsed ("folded") stack format read by flamegraph.pl, inferno and speedscope.
+- Heap: HeapProfiler wraps tracemalloc. Snapshots and the diff of the last two are reported as
+  the top allocation sites, or as folded stacks weighted by bytes.
+- Runtime: LoopLagMonitor measures how late the event loop wakes up, executor_stats() reports
+  the queue of the default executor that asyncio.to_thread runs on.
+- Memory: process_memory(), scan_objects() and store_memory() report RSS, loaded models, object
+  counts per type and the bytes held by every knowledge store and cache.
+
+Nothing runs until an admin starts it, apart from the event loop lag sampler.
+
+Usage (against a running server, admin token in ADMIN_TOKEN):
+    python profiling.py cpu --seconds 30 -o cpu.folded   # flamegraph.pl cpu.folded > cpu.svg
+    python profiling.py heap start
+    python profiling.py heap snapshot                    # before and after the suspected leak
+    python profiling.py heap diff -o heap.folded
+    python profiling.py heap stop
+    python profiling.py memory [--objects]
+    python profiling.py runtime
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Leaf functions of threads that are waiting rather than working, left out of CPU profiles by default
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+def _frame_name(code) -> str:
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+def _folded(frames: List[str], count: int) -> str:
+    # Semicolons separate frames in the folded format
+    return ";".join(frame.replace(";", ":") for frame in frames) + f" {count}\n"
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class SamplingProfiler:
+    """
+    Statistical CPU profiler: a background thread records the stack of every other thread each
+    interval_ms. The cost is one stack walk per thread per sample, so it is safe to run in
+    production; it only sees Python frames, time in C extensions is charged to their caller.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.interval_ms = None
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = config.PROFILE_SAMPLE_INTERVAL_MS,
+              max_seconds: float = config.PROFILE_MAX_SECONDS):
+        if interval_ms <= 0 or max_seconds <= 0:
+            raise ValueError(f"interval_ms and max_seconds must be positive, got {interval_ms} and {max_seconds}")
+        if self.running:
+            raise RuntimeError("A CPU profile is already running")
+        self.samples = Counter()
+        self.sample_count = 0
+        self.interval_ms = interval_ms
+        self.started_at, self.stopped_at = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_ms / 1000, max_seconds),
+                                        name="cpu-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"CPU profile started, sampling every {interval_ms}ms for at most {max_seconds}s")
+
+    def _run(self, interval: float, max_seconds: float):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                self.samples[(names.get(thread_id, str(thread_id)),) + tuple(reversed(stack))] += 1
+            self.sample_count += 1
+        self.stopped_at = time.time()
+
+    def stop(self):
+        if self._thread is None:
+            raise RuntimeError("No CPU profile has been started")
+        self._stop.set()
+        self._thread.join()
+        logger.info(f"CPU profile stopped after {self.sample_count} samples")
+
+    def collapsed(self, include_idle: bool = False) -> str:
+        """Samples as folded stacks, thread name first: "thread;outer (file:line);inner (file:line) count"."""
+        lines = []
+        for (thread_name, *codes), count in self.samples.most_common():
+            leaf = codes[-1] if codes else None
+            if not include_idle and leaf and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FUNCTIONS:
+                continue
+            lines.append(_folded([thread_name] + [_frame_name(code) for code in codes], count))
+        return "".join(lines)
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_ms,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "samples": self.sample_count,
+            "stacks": len(self.samples),
+        }
+
+class HeapProfiler:
+    """
+    Allocation tracking with tracemalloc. Tracing slows allocations down noticeably, so it is
+    only on between start() and stop(). snapshot() keeps the last two snapshots for diff().
+    """
+
+    # Allocations of tracemalloc itself and of the import machinery are noise
+    FILTERS = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+
+    def __init__(self):
+        self.snapshots: deque = deque(maxlen=2)
+
+    def start(self, frames: int = config.TRACEMALLOC_FRAMES):
+        if tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is already tracing")
+        self.snapshots.clear()
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc started with {frames} frames per allocation")
+
+    def stop(self):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        tracemalloc.stop()
+        self.snapshots.clear()
+        logger.info("tracemalloc stopped")
+
+    def snapshot(self):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Start tracemalloc before taking snapshots")
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def report(self, snapshot, limit: int = 25) -> Dict:
+        current, peak = tracemalloc.get_traced_memory()
+        stats = snapshot.statistics("lineno")
+        return {
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "snapshot_bytes": sum(stat.size for stat in stats),
+            "top": [
+                {"location": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+                for stat in stats[:limit]
+            ],
+        }
+
+    def diff(self, limit: int = 25) -> Dict:
+        """Growth between the last two snapshots, largest first."""
+        old, new = self._last_two()
+        stats = new.compare_to(old, "lineno")
+        return {
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [
+                {"location": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "bytes": stat.size,
+                 "count_diff": stat.count_diff}
+                for stat in stats[:limit]
+            ],
+        }
+
+    def collapsed(self, snapshot) -> str:
+        """Live allocations as folded stacks weighted by bytes."""
+        return "".join(
+            _folded([str(frame) for frame in stat.traceback], stat.size)
+            for stat in snapshot.statistics("traceback")
+        )
+
+    def collapsed_diff(self) -> str:
+        """Allocation growth between the last two snapshots as folded stacks weighted by bytes."""
+        old, new = self._last_two()
+        return "".join(
+            _folded([str(frame) for frame in stat.traceback], stat.size_diff)
+            for stat in new.compare_to(old, "traceback") if stat.size_diff > 0
+        )
+
+    def _last_two(self):
+        if len(self.snapshots) < 2:
+            raise RuntimeError("Take two snapshots before diffing")
+        return self.snapshots[0], self.snapshots[1]
+
+    def status(self) -> Dict:
+        status = {"tracing": tracemalloc.is_tracing(), "snapshots": len(self.snapshots)}
+        if tracemalloc.is_tracing():
+            status["traced_bytes"], status["peak_traced_bytes"] = tracemalloc.get_traced_memory()
+            status["frames"] = tracemalloc.get_traceback_limit()
+        return status
+
+class LoopLagMonitor:
+    """
+    Event loop lag: how much later than asked a sleep on the loop wakes up. Lag means
+    something is running on the loop that should be in a thread.
+    """
+
+    def __init__(self, interval_s: float = config.LOOP_LAG_INTERVAL_S, window: int = config.LOOP_LAG_WINDOW):
+        self.interval_s = interval_s
+        self.lags_ms: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.lags_ms.append(max(0.0, (loop.time() - start - self.interval_s) * 1000))
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+
+    def snapshot(self) -> Dict:
+        lags = list(self.lags_ms)
+        return {
+            "window_s": round(len(lags) * self.interval_s, 1),
+            "last_ms": round(lags[-1], 2) if lags else 0.0,
+            "p50_ms": round(percentile(lags, 50), 2),
+            "p99_ms": round(percentile(lags, 99), 2),
+            "max_ms": round(max(lags, default=0.0), 2),
+        }
+
+def executor_stats(loop: asyncio.AbstractEventLoop) -> Dict:
+    """Threads and queued work of the loop's default executor, used by asyncio.to_thread."""
+    # asyncio creates the default executor on first use and keeps it in a private attribute
+    executor = getattr(loop, "_default_executor", None)
+    if executor is None:
+        return {"started": False}
+    return {
+        "started": True,
+        "max_workers": executor._max_workers,
+        "threads": len(executor._threads),
+        "queued": executor._work_queue.qsize(),
+    }
+
+def process_memory() -> Dict:
+    """Resident set size of the process, now and at its peak."""
+    memory = {"threads": threading.active_count(), "gc_counts": gc.get_count()}
+    try:
+        with open("/proc/self/statm") as f:
+            memory["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        memory["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    return memory
+
+def _model_bytes(model) -> Optional[int]:
+    module = model if hasattr(model, "parameters") else getattr(model, "model", None)
+    try:
+        tensors = itertools.chain(module.parameters(), module.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    except Exception:
+        return None
+
+def scan_objects(model_types=("SentenceTransformer", "CrossEncoder"), limit: int = 30) -> Dict:
+    """
+    Walk every object the garbage collector tracks: the most common types, to spot leaked
+    objects such as chat sessions, and every loaded model with its weight bytes, to spot
+    duplicate copies. Takes a while on a large heap, so run it off the event loop.
+    """
+    counts = Counter()
+    models = []
+    for obj in gc.get_objects():
+        type_name = type(obj).__name__
+        counts[f"{type(obj).__module__}.{type_name}"] += 1
+        if type_name in model_types:
+            models.append({"type": type_name, "id": hex(id(obj)), "weights_bytes": _model_bytes(obj)})
+    return {
+        "tracked_objects": sum(counts.values()),
+        "models": models,
+        "top_types": dict(counts.most_common(limit)),
+    }
+
+def store_memory(store, views: Dict[str, object]) -> Dict:
+    """
+    Bytes held by a knowledge store and its caches, and the share of the expert views
+    querying it (per PDFRag for stores holding a single PDF).
+    """
+    footprint = store.memory_footprint(per_document=True)
+    documents = footprint.pop("documents", {})
+    experts = {}
+    for name, view in views.items():
+        doc_ids = view.filter_doc_ids if view.filter_doc_ids is not None else documents.keys()
+        shares = [documents[doc_id] for doc_id in doc_ids if doc_id in documents]
+        experts[name] = {
+            "documents": len(shares),
+            "chunks": sum(share["chunks"] for share in shares),
+            "embeddings_bytes": sum(share["embeddings_bytes"] for share in shares),
+            "chunk_text_bytes": sum(share["chunk_text_bytes"] for share in shares),
+        }
+    caches = store.cache_stats()
+    return {
+        "type": type(store).__name__,
+        **footprint,
+        "cache_bytes": {name: stats["memory_bytes"] for name, stats in caches.items()},
+        "documents": documents,
+        "experts": experts,
+    }
+
+def _admin_request(url: str, path: str, method: str = "GET", timeout: float = 60.0):
+    request = urllib.request.Request(url.rstrip("/") + path, method=method,
+                                     headers={"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read().decode("utf-8")
+        return json.loads(body) if response.headers.get_content_type() == "application/json" else body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("cpu", "heap", "memory", "runtime"))
+    parser.add_argument("action", nargs="?", choices=("start", "snapshot", "diff", "stop"), help="For heap")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--seconds", type=float, default=30.0, help="CPU profile duration")
+    parser.add_argument("--interval-ms", type=float, default=config.PROFILE_SAMPLE_INTERVAL_MS)
+    parser.add_argument("--idle", action="store_true", help="Keep samples of waiting threads")
+    parser.add_argument("--objects", action="store_true", help="memory: also count objects per type")
+    parser.add_argument("-o", "--output", help="Write folded stacks here instead of JSON to stdout")
+    args = parser.parse_args()
+
+    if args.command == "cpu":
+        result = _admin_request(
+            args.url, f"/admin/profile/cpu?seconds={args.seconds}&interval_ms={args.interval_ms}"
+                      f"&include_idle={str(args.idle).lower()}", timeout=args.seconds + 60)
+    elif args.command == "heap":
+        if not args.action:
+            parser.error("heap needs an action: start, snapshot, diff or stop")
+        output_format = "folded" if args.output else "json"
+        if args.action == "diff":
+            result = _admin_request(args.url, f"/admin/profile/heap/diff?format={output_format}")
+        else:
+            suffix = f"?format={output_format}" if args.action == "snapshot" else ""
+            result = _admin_request(args.url, f"/admin/profile/heap/{args.action}{suffix}", method="POST")
+    elif args.command == "memory":
+        result = _admin_request(args.url, f"/admin/memory?objects={str(args.objects).lower()}")
+    else:
+        result = _admin_request(args.url, "/admin/runtime")
+
+    if isinstance(result, str):
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(result)
+            print(f"Wrote {result.count(chr(10))} stacks to {args.output}")
+        else:
+            print(result, end="")
+    else:
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
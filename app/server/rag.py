@@ -1,43 +1,592 @@
-import fitz  # PyMuPDF
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+import logging
+import config
+from chunking import ChunkingConfig, StructureAwareChunker, tokenizer_token_counter
+from pdf_extraction import iter_pdf_pages, batched
+from retrieval_cache import LRUCache
+from embeddings import load_embedder
+from compression import ExtractiveCompressor
+from budget import default_budget
 
-class PDFRag:
-    def __init__(self, pdf_path, chunk_size=1000, overlap=200):
+logger = logging.getLogger(__name__)
+
+# faiss, torch and PyMuPDF are imported where they are first used, so importing this
+# module (and starting the server) stays fast; they are loaded by the warm-up thread.
+
+# Keeps statute identifiers such as "18.2-152.4" or "1030(a)(2)" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*(?:\([a-z0-9]+\))*")
+
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lowercased terms; compound identifiers also yield their parts so "1030(a)(2)" matches "1030"."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+class BM25Index:
+    """Inverted index over the chunks, scored with Okapi BM25."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.doc_lengths = []
+        for doc_id, document in enumerate(documents):
+            terms = tokenize(document)
+            self.doc_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                self.postings[term][doc_id] = freq
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def _idf(self, term):
+        doc_freq = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_lengths) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, k, allowed=None):
+        """Return up to k (None for all) (doc_id, score) pairs, best first, optionally only among allowed doc ids."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, freq in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of ids into one, best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+def build_faiss_index(embeddings, index_type="flat", metric="l2", **params):
+    """
+    Build a FAISS index over float32 embeddings.
+
+    index_type: "flat" (exact), "hnsw" (graph, params M / ef_construction / ef_search)
+        or "ivfpq" (compressed, params nlist / m / nbits / nprobe).
+    metric: "l2", or "cosine" for inner product over normalized vectors; with cosine the
+        embeddings are normalized in place and queries must be normalized too.
+    """
+    import faiss
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}. Available: {list(INDEX_TYPES)}")
+    if metric not in ("l2", "cosine"):
+        raise ValueError(f"Unknown metric: {metric}")
+    num_vectors, dim = embeddings.shape
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+    if metric == "cosine":
+        faiss.normalize_L2(embeddings)
+
+    if index_type == "ivfpq":
+        # IVF needs ~39 training points per list and PQ 2**nbits per codebook
+        nbits = params.get("nbits", 8)
+        nlist = min(params.get("nlist", 256), max(1, num_vectors // 39))
+        m = params.get("m", 8)
+        if num_vectors < 2 ** nbits or dim % m != 0:
+            logger.warning(f"Not enough vectors ({num_vectors}) for IVF-PQ with m={m}, nbits={nbits}; using flat index")
+            index_type = "flat"
+        else:
+            quantizer = faiss.IndexFlatIP(dim) if metric == "cosine" else faiss.IndexFlatL2(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss_metric)
+            index.train(embeddings)
+            index.nprobe = min(params.get("nprobe", 16), nlist)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params.get("M", 32), faiss_metric)
+        index.hnsw.efConstruction = params.get("ef_construction", 200)
+        index.hnsw.efSearch = params.get("ef_search", 64)
+    elif index_type == "flat":
+        index = faiss.IndexFlatIP(dim) if metric == "cosine" else faiss.IndexFlatL2(dim)
+
+    index.add(embeddings)
+    return index
+
+def _search_params(index, selector):
+    """Search parameters restricting any supported index type to the ids in selector."""
+    import faiss
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def index_memory_bytes(index):
+    """Resident size of an index estimated from its vector count and layout, without copying it."""
+    import faiss
+    dim, ntotal = index.d, index.ntotal
+    if isinstance(index, faiss.IndexHNSW):
+        m = index.hnsw.nb_neighbors(1)
+        # Level 0 links 2*M neighbors per vector, higher levels M each, and a vector has
+        # 1/(M-1) higher levels on average; plus its level and 64-bit offset
+        links = ntotal * (2 * m + m / max(1, m - 1))
+        return int(ntotal * dim * 4 + links * 4 + ntotal * 12)
+    if isinstance(index, faiss.IndexIVF):
+        # Flat coarse quantizer, PQ codebooks, and per vector its code and 64-bit id in an inverted list
+        codebooks = index.pq.ksub * dim * 4 if isinstance(index, faiss.IndexIVFPQ) else 0
+        return int(index.nlist * dim * 4 + codebooks + ntotal * (index.code_size + 8))
+    return int(ntotal * getattr(index, "code_size", dim * 4))
+
+@lru_cache(maxsize=None)
+def _load_cross_encoder(model_name):
+    # Shared by every KnowledgeStore so the reranker is loaded only once
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+@dataclass
+class _Snapshot:
+    """Immutable, fully built state of a KnowledgeStore; replaced as a whole on every update."""
+    documents: dict  # doc_id -> metadata
+    chunks: list
+    embeddings: object  # np.ndarray or None
+    index: object  # faiss index or None
+    bm25: object  # BM25Index or None
+    doc_chunk_ids: dict  # doc_id -> np.ndarray of chunk ids
+    version: int = 0
+
+def normalize_prompt(prompt):
+    # all-MiniLM-L6-v2 lowercases its input, so case and whitespace don't change the embedding
+    return " ".join(prompt.lower().split())
+
+def _chunk_hash(chunk):
+    return hashlib.sha1(chunk.text.encode("utf-8")).hexdigest()
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class KnowledgeStore:
+    """
+    One embedding model, one FAISS index and one BM25 index over every corpus.
+    Agents query it through CorpusView filters, so a document used by several experts
+    is stored once and one prompt embedding and dense search can serve all of them.
+
+    Documents can be added, replaced and removed while queries are being served: updates
+    are staged, only chunks whose text changed are embedded, and publish() swaps in a newly
+    built snapshot atomically. Queries always run against one consistent snapshot.
+    """
+
+    def __init__(self, retrieval_mode=config.RAG_RETRIEVAL_MODE, rerank=config.RAG_RERANK, index_config=None,
+                 embedding_backend=config.EMBEDDING_BACKEND):
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        self.index_config = index_config or config.RAG_INDEX
+        self.embedding_backend = embedding_backend
+        self.rerank = rerank
+
+        # Staged documents: doc_id -> {"metadata": dict, "chunks": [Chunk], "hashes": [str], "embeddings": np.ndarray}
+        self._staged = {}
+        self._update_lock = threading.Lock()
+        self._snapshot = _Snapshot({}, [], None, None, None, {})
+        self.embedding_cache = LRUCache(config.RAG_EMBEDDING_CACHE_SIZE, sizeof=lambda vector: vector.nbytes)
+        # Keys include the snapshot version, so publishing a new snapshot invalidates old results
+        self.result_cache = LRUCache(config.RAG_RESULT_CACHE_SIZE)
+        self._compressor = None
+
+    @property
+    def model(self):
+        # Loaded on first use, so creating a store is cheap and the load can happen in the background
+        return load_embedder(self.embedding_backend)
+
+    @property
+    def compressor(self):
+        if self._compressor is None:
+            self._compressor = ExtractiveCompressor(
+                lambda sentences: self.model.encode(sentences, batch_size=config.RAG_EMBED_BATCH_SIZE),
+                default_budget.counter.count
+            )
+        return self._compressor
+
+    @property
+    def reranker(self):
+        return _load_cross_encoder(config.RAG_RERANKER_MODEL) if self.rerank else None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def documents(self):
+        return self._snapshot.documents
+
+    @property
+    def chunks(self):
+        return self._snapshot.chunks
+
+    @property
+    def embeddings(self):
+        return self._snapshot.embeddings
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    def add_pdf(self, pdf_path, doc_id=None, metadata=None, chunking_config=None):
+        """
+        Stage a PDF as document doc_id (defaults to its path) unless it is already staged.
+        Call publish() once all documents are added.
+        """
+        doc_id = doc_id or pdf_path
+        if doc_id in self._staged:
+            return doc_id
+        return self.upsert_pdf(pdf_path, doc_id, metadata, chunking_config, publish=False)
+
+    def upsert_pdf(self, pdf_path, doc_id=None, metadata=None, chunking_config=None, publish=True):
+        """
+        Add or replace document doc_id with the contents of pdf_path. An unchanged file is
+        skipped, and chunks whose text is already in the store reuse their embeddings.
+        Returns the document id.
+        """
+        doc_id = doc_id or pdf_path
+        file_hash = _file_hash(pdf_path)
+        with self._update_lock:
+            existing = self._staged.get(doc_id)
+            if existing and existing["metadata"].get("file_hash") == file_hash and metadata is None:
+                logger.info(f"{doc_id} is unchanged, skipping")
+                return doc_id
+            chunking_config = chunking_config or ChunkingConfig.for_corpus(pdf_path)
+            chunks, hashes, embeddings = self._ingest(pdf_path, doc_id, chunking_config)
+            self._staged[doc_id] = {
+                "metadata": dict(metadata or (existing or {}).get("metadata", {}), path=pdf_path, file_hash=file_hash),
+                "chunks": chunks,
+                "hashes": hashes,
+                "embeddings": embeddings,
+            }
+            if publish:
+                self._publish_locked()
+        return doc_id
+
+    def remove_document(self, doc_id, publish=True):
+        """Remove a document. Returns False if it wasn't in the store."""
+        with self._update_lock:
+            if self._staged.pop(doc_id, None) is None:
+                return False
+            if publish:
+                self._publish_locked()
+        return True
+
+    def _staged_metadata(self):
+        """doc_id -> metadata of the staged documents, copied under the update lock."""
+        with self._update_lock:
+            return {doc_id: dict(document["metadata"]) for doc_id, document in self._staged.items()}
+
+    def _known_embeddings(self):
+        """chunk text hash -> embedding row, over every staged document."""
+        known = {}
+        for document in self._staged.values():
+            for chunk_hash, row in zip(document["hashes"], document["embeddings"]):
+                known[chunk_hash] = row
+        return known
+
+    def _ingest(self, pdf_path, doc_id, chunking_config):
+        """
+        Stream pages from the parallel extractor straight into the chunker and embed
+        the chunks in batches, so the whole document text is never held at once.
+        Only chunks whose text isn't already in the store are embedded.
+        """
+        chunker = StructureAwareChunker(chunking_config, tokenizer_token_counter(self.model.tokenizer))
+        known = self._known_embeddings()
+        chunks, hashes, embeddings = [], [], []
+        embedded = 0
+        for batch in batched(chunker.chunk_pages(iter_pdf_pages(pdf_path)), config.RAG_EMBED_BATCH_SIZE):
+            batch_hashes = [_chunk_hash(chunk) for chunk in batch]
+            new = [i for i, chunk_hash in enumerate(batch_hashes) if chunk_hash not in known]
+            if new:
+                vectors = self.model.encode([batch[i].text for i in new], convert_to_numpy=True).astype('float32')
+                for i, vector in zip(new, vectors):
+                    known[batch_hashes[i]] = vector
+                embedded += len(new)
+            for chunk in batch:
+                chunk.doc_id = doc_id
+            chunks.extend(batch)
+            hashes.extend(batch_hashes)
+            embeddings.append(np.stack([known[chunk_hash] for chunk_hash in batch_hashes]))
+        if not chunks:
+            raise ValueError(f"No text extracted from {pdf_path}")
+        logger.info(f"Ingested {doc_id}: {len(chunks)} chunks, {embedded} newly embedded")
+        return chunks, hashes, np.vstack(embeddings).astype('float32')
+
+    def publish(self):
+        """Build the shared dense and sparse indexes over the staged documents and swap them in."""
+        with self._update_lock:
+            self._publish_locked()
+
+    def _publish_locked(self):
+        chunks, embeddings, doc_chunk_ids = [], [], {}
+        for doc_id, document in self._staged.items():
+            start = len(chunks)
+            chunks.extend(document["chunks"])
+            embeddings.append(document["embeddings"])
+            doc_chunk_ids[doc_id] = np.arange(start, len(chunks), dtype='int64')
+
+        index = bm25 = all_embeddings = None
+        if chunks:
+            all_embeddings = np.vstack(embeddings)
+            # Keep a single copy: staged embeddings become views into the shared matrix
+            for doc_id, document in self._staged.items():
+                ids = doc_chunk_ids[doc_id]
+                document["embeddings"] = all_embeddings[ids[0]:ids[-1] + 1]
+            index = build_faiss_index(
+                all_embeddings.copy(),
+                self.index_config.get("type", "flat"),
+                self.index_config.get("metric", "l2"),
+                **self.index_config.get("params", {})
+            )
+            bm25 = BM25Index([chunk.text for chunk in chunks]) if self.retrieval_mode == "hybrid" else None
+
+        documents = {doc_id: dict(document["metadata"], chunks=len(document["chunks"]))
+                     for doc_id, document in self._staged.items()}
+        # A single reference assignment, so readers see either the old or the new snapshot
+        self._snapshot = _Snapshot(documents, chunks, all_embeddings, index, bm25, doc_chunk_ids,
+                                   self._snapshot.version + 1)
+        # Results of older snapshots can never be hit again
+        self.result_cache.clear()
+        logger.info(f"Published knowledge store v{self._snapshot.version}: {len(documents)} documents, "
+                    f"{len(chunks)} chunks, memory {self.memory_footprint()}")
+
+    def sync_directory(self, directory):
+        """
+        Make the store mirror the PDFs in a directory: new and changed files are upserted,
+        documents whose file is gone are removed, then one snapshot is published.
+        Returns the ids of the added/replaced and removed documents.
+        """
+        paths = {os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(".pdf")}
+        root = Path(directory).resolve()
+        present = {Path(path).resolve() for path in paths}
+        # Files already in the store keep their document id, which /admin/corpus may have chosen
+        doc_ids = {Path(metadata["path"]).resolve(): doc_id
+                   for doc_id, metadata in self._staged_metadata().items() if metadata.get("path")}
+        changed, removed = [], []
+        for path in sorted(paths):
+            doc_id = doc_ids.get(Path(path).resolve(), path)
+            version = self._staged_metadata().get(doc_id, {}).get("file_hash")
+            self.upsert_pdf(path, doc_id=doc_id, publish=False)
+            if self._staged_metadata()[doc_id].get("file_hash") != version:
+                changed.append(doc_id)
+        for doc_id, metadata in self._staged_metadata().items():
+            path = metadata.get("path")
+            # Compared by path components, so syncing "assets" leaves "assets2/" alone
+            if path and Path(path).resolve().is_relative_to(root) and Path(path).resolve() not in present:
+                self.remove_document(doc_id, publish=False)
+                removed.append(doc_id)
+        if changed or removed:
+            self.publish()
+        return {"changed": changed, "removed": removed}
+
+    def view(self, doc_ids=None, where=None):
+        """A filtered view over the documents with the given ids and/or matching metadata."""
+        return CorpusView(self, doc_ids, where)
+
+    def resolve(self, doc_ids=None, where=None, snapshot=None):
+        """Ids of the documents passing the filters."""
+        snapshot = snapshot or self._snapshot
+        resolved = []
+        for doc_id, metadata in snapshot.documents.items():
+            if doc_ids is not None and doc_id not in doc_ids:
+                continue
+            if where and any(metadata.get(key) != value for key, value in where.items()):
+                continue
+            resolved.append(doc_id)
+        return resolved
+
+    def memory_footprint(self, per_document=False):
+        """Bytes held by the store, per component, and optionally per document."""
+        snapshot = self._snapshot
+        footprint = {
+            "index_bytes": index_memory_bytes(snapshot.index) if snapshot.index is not None else 0,
+            "embeddings_bytes": int(snapshot.embeddings.nbytes) if snapshot.embeddings is not None else 0,
+            "chunk_text_bytes": sum(len(chunk.text.encode("utf-8")) for chunk in snapshot.chunks),
+        }
+        if per_document:
+            footprint["documents"] = self._document_footprint(snapshot)
+        return footprint
+
+    def _document_footprint(self, snapshot):
+        """Chunks and bytes per document; the index is shared, so it is only counted for the store."""
+        embeddings = snapshot.embeddings
+        row_bytes = embeddings.nbytes // len(embeddings) if embeddings is not None and len(embeddings) else 0
+        return {
+            doc_id: {
+                "chunks": len(chunk_ids),
+                "embeddings_bytes": int(len(chunk_ids) * row_bytes),
+                "chunk_text_bytes": sum(len(snapshot.chunks[i].text.encode("utf-8")) for i in chunk_ids),
+            }
+            for doc_id, chunk_ids in snapshot.doc_chunk_ids.items()
+        }
+
+    def cache_stats(self):
+        stats = {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+        if self._compressor is not None:
+            stats["sentence_embeddings"] = self._compressor.cache.stats()
+        return stats
+
+    def embed_query(self, prompt):
+        import faiss
+        key = normalize_prompt(prompt)
+        prompt_vec = self.embedding_cache.get(key)
+        if prompt_vec is None:
+            prompt_vec = self.model.encode([key])[0].astype('float32').reshape(1, -1)
+            if self.index_config.get("metric") == "cosine":
+                faiss.normalize_L2(prompt_vec)
+            self.embedding_cache.put(key, prompt_vec)
+        return prompt_vec
+
+    @staticmethod
+    def _chunk_ids(snapshot, doc_ids):
+        if not doc_ids:
+            return np.empty(0, dtype='int64')
+        return np.concatenate([snapshot.doc_chunk_ids[doc_id] for doc_id in doc_ids])
+
+    @staticmethod
+    def _dense_search(snapshot, prompt_vec, k, chunk_ids=None):
+        import faiss
+        if chunk_ids is None:
+            _, indices = snapshot.index.search(prompt_vec, k)
+        else:
+            params = _search_params(snapshot.index, faiss.IDSelectorBatch(chunk_ids))
+            _, indices = snapshot.index.search(prompt_vec, k, params=params)
+        return [int(i) for i in indices[0] if i != -1]
+
+    def _rerank(self, snapshot, prompt, candidate_ids, k):
+        scores = self.reranker.predict([(prompt, snapshot.chunks[i].text) for i in candidate_ids])
+        ranked = sorted(zip(candidate_ids, scores), key=lambda item: item[1], reverse=True)
+        return [i for i, _ in ranked[:k]]
+
+    def _rank(self, snapshot, prompt, dense_ids, sparse_ids, num_chunks):
+        """Fuse and rerank one view's candidates into its final chunk ids."""
+        pool = max(num_chunks, config.RAG_CANDIDATE_POOL)
+        candidate_ids = dense_ids[:pool]
+        if snapshot.bm25:
+            candidate_ids = reciprocal_rank_fusion([candidate_ids, sparse_ids[:pool]])[:pool]
+        if self.reranker:
+            candidate_ids = self._rerank(snapshot, prompt, candidate_ids, num_chunks)
+        return candidate_ids[:num_chunks]
+
+    def search_views(self, prompt, views, num_chunks=config.RAG_NUM_CHUNKS):
+        """
+        Retrieve chunks for several views at once: the prompt is embedded once and one
+        dense and one sparse search over the union of the views is bucketed per view.
+        A view whose bucket comes up short gets its own filtered dense search.
+        Results are cached per (snapshot, view, prompt, k), so only uncached views are searched.
+        Returns one list of chunks per view.
+        """
+        snapshot = self._snapshot
+        normalized = normalize_prompt(prompt)
+        all_view_doc_ids = [frozenset(view.doc_ids(snapshot)) for view in views]
+        keys = [(snapshot.version, doc_ids, normalized, num_chunks) for doc_ids in all_view_doc_ids]
+        cached = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, chunk_ids in enumerate(cached) if chunk_ids is None]
+        if missing:
+            found = self._search_uncached(snapshot, prompt, [all_view_doc_ids[i] for i in missing], num_chunks)
+            for i, chunk_ids in zip(missing, found):
+                self.result_cache.put(keys[i], chunk_ids)
+                cached[i] = chunk_ids
+        return [[snapshot.chunks[i] for i in chunk_ids] for chunk_ids in cached]
+
+    def context_views(self, prompt, views, num_chunks=None):
+        """
+        Formatted RAG context for several views at once, one list of passages per view.
+        With config.RAG_COMPRESSION enabled, more chunks are retrieved and cut down to the
+        sentences most relevant to the prompt; otherwise the chunks are returned whole.
+        """
+        compression = config.RAG_COMPRESSION
+        if not compression["enabled"]:
+            return [format_rag_context(chunks) for chunks in self.search_views(prompt, views, num_chunks or config.RAG_NUM_CHUNKS)]
+        results = self.search_views(prompt, views, num_chunks or compression["num_chunks"])
+        if not any(results):
+            # Nothing to compress, so don't embed the prompt (or load the model) for it
+            return [[] for _ in results]
+        prompt_vec = self.embed_query(prompt)
+        return [self.compressor.compress(prompt_vec, chunks) for chunks in results]
+
+    def _search_uncached(self, snapshot, prompt, view_doc_ids, num_chunks):
+        """Search the given views of a snapshot; returns one tuple of chunk ids per view."""
+        union = sorted(set().union(*view_doc_ids))
+        if not union:
+            return [() for _ in view_doc_ids]
+        pool = max(num_chunks, config.RAG_CANDIDATE_POOL) if (snapshot.bm25 or self.reranker) else num_chunks
+
+        prompt_vec = self.embed_query(prompt)
+        union_ids = None if len(union) == len(snapshot.documents) else self._chunk_ids(snapshot, union)
+        dense_ids = self._dense_search(snapshot, prompt_vec, pool * len(view_doc_ids), union_ids)
+        sparse_ids = []
+        if snapshot.bm25:
+            allowed = None if union_ids is None else set(union_ids.tolist())
+            sparse_ids = [i for i, _ in snapshot.bm25.search(prompt, None, allowed=allowed)]
+
+        results = []
+        for doc_ids in view_doc_ids:
+            view_dense = [i for i in dense_ids if snapshot.chunks[i].doc_id in doc_ids]
+            available = sum(len(snapshot.doc_chunk_ids[doc_id]) for doc_id in doc_ids)
+            if len(view_dense) < min(pool, available):
+                view_dense = self._dense_search(snapshot, prompt_vec, pool, self._chunk_ids(snapshot, sorted(doc_ids)))
+            view_sparse = [i for i in sparse_ids if snapshot.chunks[i].doc_id in doc_ids]
+            results.append(tuple(self._rank(snapshot, prompt, view_dense, view_sparse, num_chunks)))
+        return results
+
+class CorpusView:
+    """Read-only view of a KnowledgeStore restricted to some documents."""
+
+    def __init__(self, store, doc_ids=None, where=None):
+        self.store = store
+        self.filter_doc_ids = set(doc_ids) if doc_ids is not None else None
+        self.where = where
+
+    def doc_ids(self, snapshot=None):
+        # Resolved on every query so documents added or removed later are picked up
+        return self.store.resolve(self.filter_doc_ids, self.where, snapshot)
+
+    def search(self, prompt, num_chunks=config.RAG_NUM_CHUNKS):
+        """Return the most relevant chunks, with their page and section metadata."""
+        return self.store.search_views(prompt, [self], num_chunks)[0]
+
+    def get_rag_context(self, prompt, num_chunks=None):
+        return self.store.context_views(prompt, [self], num_chunks)[0]
+
+def format_rag_context(chunks):
+    return [f"[{chunk.reference}]\n{chunk.text}" for chunk in chunks]
+
+class PDFRag(CorpusView):
+    """A knowledge store holding a single PDF."""
+
+    def __init__(self, pdf_path, chunking_config=None, retrieval_mode=config.RAG_RETRIEVAL_MODE,
+                 rerank=config.RAG_RERANK, index_config=None, embedding_backend=config.EMBEDDING_BACKEND):
+        store = KnowledgeStore(retrieval_mode, rerank, index_config, embedding_backend)
+        store.upsert_pdf(pdf_path, chunking_config=chunking_config)
+        super().__init__(store, [pdf_path])
         self.pdf_path = pdf_path
-        self.chunk_size = chunk_size
-        self.overlap = overlap
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-
-        self.text = self._extract_pdf_text()
-        self.chunks = self._chunk_text()
-        self.embeddings = self._embed_chunks()
-        self.index = self._create_faiss_index()
-
-    def _extract_pdf_text(self):
-        doc = fitz.open(self.pdf_path)
-        return "".join(page.get_text() for page in doc)
-
-    def _chunk_text(self):
-        chunks = []
-        start = 0
-        while start < len(self.text):
-            end = min(len(self.text), start + self.chunk_size)
-            chunks.append(self.text[start:end])
-            start += self.chunk_size - self.overlap
-        return chunks
-
-    def _embed_chunks(self):
-        return self.model.encode(self.chunks, convert_to_numpy=True)
-
-    def _create_faiss_index(self):
-        dim = self.embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(self.embeddings)
-        return index
-
-    def get_rag_context(self, prompt, num_chunks=5):
-        prompt_vec = self.model.encode([prompt])[0].astype('float32').reshape(1, -1)
-        _, indices = self.index.search(prompt_vec, num_chunks)
-        return [self.chunks[i] for i in indices[0]]
+        self.model = store.model
+        self.embeddings = store.embeddings
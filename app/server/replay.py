@@ -0,0 +1,403 @@
+"""
+Replay recorded prompts against candidate council configurations and compare them.
+
+Prompts come from the audit trail (council_audit.jsonl or the SQLite audit table), whose recorded
+verdicts are the reference, or from a text file with one prompt per line. Each candidate is a
+JSON file overriding parts of the production council, e.g.
+
+    {
+        "name": "flash-8b-lighter-scientist",
+        "model": "gemini-1.5-flash-8b",
+        "council_mode": "single_call",
+        "experts": {"scientist": {"weight": 0.7}, "child_safety_expert": null},
+        "prompts": {"judge": "..."}
+    }
+
+"experts" entries are merged into config.COUNCIL_EXPERTS (null removes an expert) and "prompts"
+replaces the system prompt of an expert or of the judge. The production council is always
+replayed first as the baseline the candidates are compared with.
+
+Usage:
+    python replay.py council_audit.jsonl candidate.json [candidate.json ...] [--llm stub|cached|live]
+        [--cache replay_cache.db] [--concurrency 8] [--limit 500] [--rag]
+
+--llm stub (the default) answers from benchmarks.StubModel; cached replays responses stored in
+--cache and only calls Gemini for prompts it has not seen; live always calls Gemini.
+"""
+import argparse
+import asyncio
+import copy
+import hashlib
+import glob
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import config
+from agent_prompts import get_prompt_for_council_member, get_prompt_for_council_leader
+from agents import AgentManager, Agent, JudgeAgent, AgentConfig, parse_verdict
+from audit import council_record
+from profiling import percentile
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CouncilCandidate:
+    name: str
+    model: str = config.GEMINI_MODEL_NAME
+    # None uses config.COUNCIL_MODE, like production
+    council_mode: Optional[str] = None
+    experts: Dict[str, Dict] = field(default_factory=lambda: copy.deepcopy(config.COUNCIL_EXPERTS))
+    # System prompt overrides by agent name, "judge" included
+    prompts: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CouncilCandidate":
+        experts = copy.deepcopy(config.COUNCIL_EXPERTS)
+        for name, override in data.get("experts", {}).items():
+            if override is None:
+                experts.pop(name, None)
+            else:
+                experts[name] = dict(experts.get(name, {"weight": 1.0, "rag_path": None}), **override)
+        return cls(
+            name=data["name"],
+            model=data.get("model", config.GEMINI_MODEL_NAME),
+            council_mode=data.get("council_mode"),
+            experts=experts,
+            prompts=data.get("prompts", {})
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "CouncilCandidate":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+def build_council(candidate: CouncilCandidate, model, knowledge_store=None) -> AgentManager:
+    """Build the council a candidate describes. Experts only get RAG context with a knowledge store."""
+    manager = AgentManager()
+    manager.set_judge(JudgeAgent(AgentConfig(
+        name="judge",
+        weight=1.0,
+        system_prompt=candidate.prompts.get("judge") or get_prompt_for_council_leader(),
+        api_key=None
+    ), model))
+    for name, expert in candidate.experts.items():
+        manager.add_agent(Agent(AgentConfig(
+            name=name,
+            weight=expert["weight"],
+            system_prompt=candidate.prompts.get(name) or get_prompt_for_council_member(name),
+            api_key=None,
+            rag_path=expert.get("rag_path") if knowledge_store is not None else None
+        ), model, knowledge_store))
+    return manager
+
+class CachedModel:
+    """
+    Wraps a Gemini model and stores every response in SQLite keyed by model and message, so
+    replaying the same prompts again costs nothing. Each chat of the council sends a single
+    message, which with the generation config makes a complete cache key. The wrapped model is only
+    created on the first cache miss.
+    """
+
+    def __init__(self, model_name: str, path: str, load_model):
+        self.model_name = model_name
+        self._load_model = load_model
+        self._model = None
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, text TEXT, prompt_tokens INTEGER, output_tokens INTEGER)"
+        )
+        self.stats = {"hits": 0, "misses": 0}
+
+    def start_chat(self, history=None):
+        return SimpleNamespace(send_message=self.send_message)
+
+    def send_message(self, content, generation_config=None, **kwargs):
+        # Generation limits change the response, so they are part of the key
+        settings = json.dumps(generation_config, sort_keys=True)
+        key = hashlib.sha256(f"{self.model_name}\0{settings}\0{content}".encode()).hexdigest()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT text, prompt_tokens, output_tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None and self._model is None:
+                self._model = self._load_model(self.model_name)
+        if row is not None:
+            self.stats["hits"] += 1
+            text, prompt_tokens, output_tokens = row
+        else:
+            self.stats["misses"] += 1
+            response = self._model.start_chat(history=[]).send_message(content, generation_config=generation_config)
+            usage = getattr(response, "usage_metadata", None)
+            text = response.text
+            prompt_tokens = getattr(usage, "prompt_token_count", None)
+            output_tokens = getattr(usage, "candidates_token_count", None)
+            with self._lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, text, prompt_tokens, output_tokens)
+                )
+                self.connection.commit()
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+        )
+
+def load_live_model(model_name: str = config.GEMINI_MODEL_NAME):
+    import google.auth
+    import google.generativeai as genai
+    credentials, _ = google.auth.load_credentials_from_file("api_key.json")
+    genai.configure(credentials=credentials)
+    return genai.GenerativeModel(model_name)
+
+class VerdictComparison:
+    """Running comparison of one council's decisions with reference verdicts."""
+
+    def __init__(self, name: str, max_latencies: int = 10000):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.permitted = 0
+        self.compared = 0
+        self.agreeing = 0
+        # Disagreements by direction, e.g. the candidate permits what the reference rejected
+        self.flips = {"now_permitted": 0, "now_rejected": 0}
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies = deque(maxlen=max_latencies)
+
+    def add(self, record: Optional[Dict], reference: Optional[bool], latency_s: float):
+        """
+        record is the council_record of the decision, None when the council failed. Failures count
+        as errors only, not towards the permit rate or agreement.
+        """
+        self.count += 1
+        self.latencies.append(latency_s)
+        if record is None:
+            self.errors += 1
+            return
+        self.permitted += record["permitted"]
+        self.prompt_tokens += record["prompt_tokens"]
+        self.output_tokens += record["output_tokens"]
+        if reference is not None:
+            self.compared += 1
+            if record["permitted"] == reference:
+                self.agreeing += 1
+            else:
+                self.flips["now_permitted" if record["permitted"] else "now_rejected"] += 1
+
+    def report(self) -> Dict:
+        if not self.count:
+            return {"name": self.name, "prompts": 0}
+        latencies = list(self.latencies)
+        decided = self.count - self.errors
+        return {
+            "name": self.name,
+            "prompts": self.count,
+            "errors": self.errors,
+            "permitted_rate": round(self.permitted / decided, 3) if decided else None,
+            "agreement": round(self.agreeing / self.compared, 3) if self.compared else None,
+            "disagreements": dict(self.flips),
+            "latency_p50_s": round(statistics.median(latencies), 3),
+            "latency_p95_s": round(percentile(latencies, 95), 3),
+            "latency_p99_s": round(percentile(latencies, 99), 3),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "tokens_per_prompt": round((self.prompt_tokens + self.output_tokens) / self.count),
+        }
+
+async def _timed_decision(manager: AgentManager, prompt: str, mode: Optional[str]) -> Tuple[Optional[Dict], float]:
+    start = time.perf_counter()
+    try:
+        decision = await manager.analyze_prompt(prompt, mode=mode)
+        # The council reports its own failures ("Error in final decision", "No agents available") as verdicts
+        if parse_verdict(decision["verdict"]) is None:
+            raise ValueError(f"no verdict: {decision['verdict'][:100]}")
+        return council_record(decision, prompt=prompt), time.perf_counter() - start
+    except Exception as e:
+        logger.warning(f"Council failed on replayed prompt: {str(e)}")
+        return None, time.perf_counter() - start
+
+def _recorded_permitted(verdict: Optional[str], permitted) -> Optional[bool]:
+    """The recorded decision, or None when the recorded council failed and there is nothing to compare with."""
+    if permitted is None or parse_verdict(verdict or "") is None:
+        return None
+    return bool(permitted)
+
+def _audit_record_pairs(records: List[Dict]) -> List[Tuple[str, Optional[bool]]]:
+    return [(r["prompt"], _recorded_permitted(r.get("verdict"), r.get("permitted"))) for r in records
+            if r.get("prompt") and not r.get("coalesced") and not str(r.get("mode") or "").startswith("shadow")]
+
+def load_recorded_prompts(path: str, limit: Optional[int] = None) -> List[Tuple[str, Optional[bool]]]:
+    """
+    (prompt, recorded permitted or None) pairs from an audit trail (JSONL file, SQLite database or
+    Parquet directory) or a plain prompt file.
+    """
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            pairs = _audit_record_pairs([json.loads(line) for line in f if line.strip()])
+    elif os.path.isdir(path) or path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        # The Parquet sink writes one file per batch, named by time
+        files = sorted(glob.glob(os.path.join(path, "*.parquet"))) if os.path.isdir(path) else [path]
+        if not files:
+            raise ValueError(f"No Parquet audit files in {path}")
+        pairs = _audit_record_pairs([record for file in files for record in pq.read_table(file).to_pylist()])
+    elif path.endswith((".db", ".sqlite")):
+        connection = sqlite3.connect(path)
+        rows = connection.execute(
+            "SELECT prompt, verdict, permitted FROM council_audit "
+            "WHERE prompt IS NOT NULL AND (mode IS NULL OR mode NOT LIKE 'shadow%') AND coalesced IS NOT 1 "
+            "ORDER BY timestamp"
+        ).fetchall()
+        connection.close()
+        pairs = [(prompt, _recorded_permitted(verdict, permitted)) for prompt, verdict, permitted in rows]
+    else:
+        with open(path) as f:
+            pairs = [(line.strip(), None) for line in f if line.strip()]
+    return pairs[:limit] if limit else pairs
+
+async def replay(prompts: List[Tuple[str, Optional[bool]]], candidates: List[CouncilCandidate], make_model,
+                 concurrency: int = 8, knowledge_store=None) -> Dict:
+    """
+    Run the recorded prompts through each candidate, concurrently up to concurrency prompts at a
+    time. Candidates run one after another so their latencies don't interfere. The first
+    candidate is the baseline: later candidates are compared with its verdicts as well as with
+    the recorded ones.
+    """
+    report = {"prompts": len(prompts), "candidates": []}
+    baseline: List[Optional[bool]] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    for candidate in candidates:
+        model = make_model(candidate.model)
+        manager = build_council(candidate, model, knowledge_store)
+
+        async def run(prompt: str):
+            async with semaphore:
+                return await _timed_decision(manager, prompt, candidate.council_mode)
+
+        results = await asyncio.gather(*(run(prompt) for prompt, _ in prompts))
+        vs_recorded = VerdictComparison(candidate.name)
+        vs_baseline = VerdictComparison(candidate.name)
+        for i, ((_, recorded), (record, latency)) in enumerate(zip(prompts, results)):
+            vs_recorded.add(record, recorded, latency)
+            if baseline:
+                vs_baseline.add(record, baseline[i], latency)
+        entry = dict(vs_recorded.report(), model=candidate.model, council_mode=candidate.council_mode or config.COUNCIL_MODE)
+        if isinstance(model, CachedModel):
+            entry["response_cache"] = dict(model.stats)
+        if baseline:
+            entry["agreement_with_baseline"] = vs_baseline.report()["agreement"]
+            entry["disagreements_with_baseline"] = vs_baseline.report()["disagreements"]
+        else:
+            baseline = [record["permitted"] if record else None for record, _ in results]
+        report["candidates"].append(entry)
+    return report
+
+class ShadowCouncil:
+    """
+    Evaluates a sampled fraction of live prompts with a candidate council in the background and
+    compares its verdicts with production. At most max_concurrency shadow evaluations run at a
+    time; samples beyond that are skipped so shadowing never queues up behind real traffic.
+
+    Shadow evaluations bypass admission control, so their latencies leave out the queueing
+    production requests see and are not comparable with production council latency.
+    """
+
+    def __init__(self, candidate: CouncilCandidate, manager: AgentManager, sample_rate: float = config.SHADOW_SAMPLE_RATE,
+                 max_concurrency: int = config.SHADOW_MAX_CONCURRENCY, audit_sink=None):
+        self.candidate = candidate
+        self.manager = manager
+        self.sample_rate = sample_rate
+        self.max_concurrency = max_concurrency
+        self.audit_sink = audit_sink
+        self.comparison = VerdictComparison(candidate.name)
+        self.tasks = set()
+        self.skipped = 0
+
+    def maybe_evaluate(self, request_id: str, prompt: str, production_permitted: bool):
+        """Sample this prompt for shadow evaluation; never blocks the caller."""
+        if random.random() >= self.sample_rate:
+            return
+        if len(self.tasks) >= self.max_concurrency:
+            self.skipped += 1
+            return
+        task = asyncio.create_task(self._evaluate(request_id, prompt, production_permitted))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _evaluate(self, request_id: str, prompt: str, production_permitted: bool):
+        record, latency = await _timed_decision(self.manager, prompt, self.candidate.council_mode)
+        self.comparison.add(record, production_permitted, latency)
+        if record is None:
+            return
+        if record["permitted"] != production_permitted:
+            logger.info(f"[{request_id}] Shadow council {self.candidate.name} disagrees with production: "
+                        f"{'permitted' if record['permitted'] else 'not permitted'}")
+        if self.audit_sink:
+            self.audit_sink.record(dict(
+                record,
+                request_id=request_id,
+                mode=f"shadow:{self.candidate.name}:{record['mode']}",
+                council_latency_ms=round(latency * 1000, 1)
+            ))
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def report(self) -> Dict:
+        return dict(
+            self.comparison.report(),
+            sample_rate=self.sample_rate,
+            in_flight=len(self.tasks),
+            skipped=self.skipped
+        )
+
+def _model_factory(llm: str, cache_path: str):
+    if llm == "stub":
+        from benchmarks import StubModel
+        return lambda model_name: StubModel()
+    if llm == "cached":
+        return lambda model_name: CachedModel(model_name, cache_path, load_live_model)
+    return load_live_model
+
+def _knowledge_store(candidates: List[CouncilCandidate]):
+    from rag import KnowledgeStore
+    store = KnowledgeStore()
+    for path in {e["rag_path"] for c in candidates for e in c.experts.values() if e.get("rag_path")}:
+        store.add_pdf(path)
+    store.publish()
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", help="Audit trail (.jsonl, .db) or text file with one prompt per line")
+    parser.add_argument("candidates", nargs="*", help="Candidate council JSON files")
+    parser.add_argument("--llm", choices=("stub", "cached", "live"), default="stub")
+    parser.add_argument("--cache", default="replay_cache.db", help="Response cache for --llm cached")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, help="Replay at most this many prompts")
+    parser.add_argument("--rag", action="store_true", help="Give experts their knowledge bases (embeds the PDFs)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    candidates = [CouncilCandidate(name="production")] + [CouncilCandidate.from_file(path) for path in args.candidates]
+    prompts = load_recorded_prompts(args.prompts, args.limit)
+    knowledge_store = _knowledge_store(candidates) if args.rag else None
+    report = asyncio.run(replay(prompts, candidates, _model_factory(args.llm, args.cache), args.concurrency, knowledge_store))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import sys
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count, with hit/miss and memory stats."""
+
+    def __init__(self, max_entries: int, sizeof=sys.getsizeof):
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.memory_bytes -= self._entry_size(key, self._entries.pop(key))
+            self._entries[key] = value
+            self.memory_bytes += self._entry_size(key, value)
+            while len(self._entries) > self.max_entries:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.memory_bytes -= self._entry_size(old_key, old_value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+
+    def _entry_size(self, key, value):
+        return sys.getsizeof(key) + self.sizeof(value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_bytes": self.memory_bytes,
+        }
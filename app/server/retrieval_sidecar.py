@@ -0,0 +1,182 @@
+"""
+Retrieval sidecar: one local process that owns the embedding model and the knowledge store,
+serving every uvicorn worker over a Unix socket. Workers then share one read-only copy of the
+model and indexes instead of loading their own, so RAM doesn't grow with the worker count.
+
+Usage:
+    python retrieval_sidecar.py [--socket /tmp/council-rag.sock] [--assets assets]
+    RAG_SIDECAR_SOCKET=/tmp/council-rag.sock uvicorn main:app --workers 4
+
+The protocol is one JSON request and one JSON response per line.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+from dataclasses import asdict
+from types import SimpleNamespace
+
+import config
+from chunking import Chunk
+from rag import KnowledgeStore, CorpusView
+
+logger = logging.getLogger(__name__)
+
+class RemoteKnowledgeStore:
+    """
+    Client for the retrieval sidecar with the KnowledgeStore interface used by the server:
+    agents query it through CorpusView, and the admin endpoints' updates go to the sidecar.
+    Calls block, so callers run them off the event loop like local store calls.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _call(self, op: str, timeout: float = None, **params):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout or self.timeout)
+            conn.connect(self.socket_path)
+            conn.sendall(json.dumps(dict(params, op=op)).encode("utf-8") + b"\n")
+            with conn.makefile("rb") as reader:
+                response = json.loads(reader.readline())
+        if "error" in response:
+            raise ValueError(f"Retrieval sidecar {op} failed: {response['error']}")
+        return response["result"]
+
+    def status(self):
+        return self._call("status")
+
+    @property
+    def documents(self):
+        return self.status()["documents"]
+
+    @property
+    def version(self):
+        return self.status()["version"]
+
+    @property
+    def snapshot(self):
+        return SimpleNamespace(version=self.version)
+
+    def view(self, doc_ids=None, where=None):
+        return CorpusView(self, doc_ids, where)
+
+    def resolve(self, doc_ids=None, where=None, snapshot=None):
+        """Ids of the documents passing the filters, in the sidecar's current snapshot (snapshot is ignored)."""
+        return self._call("resolve", doc_ids=sorted(doc_ids) if doc_ids is not None else None, where=where)
+
+    @staticmethod
+    def _views(views):
+        return [
+            {"doc_ids": sorted(view.filter_doc_ids) if view.filter_doc_ids is not None else None, "where": view.where}
+            for view in views
+        ]
+
+    def search_views(self, prompt, views, num_chunks=config.RAG_NUM_CHUNKS):
+        results = self._call("search", prompt=prompt, num_chunks=num_chunks, views=self._views(views))
+        return [[Chunk(**chunk) for chunk in chunks] for chunks in results]
+
+    def context_views(self, prompt, views, num_chunks=None):
+        # Compression runs in the sidecar, next to the embedding model
+        return self._call("context", prompt=prompt, num_chunks=num_chunks, views=self._views(views))
+
+    # Updates embed documents, which can take minutes
+    def upsert_pdf(self, pdf_path, doc_id=None, metadata=None, chunking_config=None, publish=True):
+        return self._call("upsert", timeout=3600, path=pdf_path, doc_id=doc_id, metadata=metadata)
+
+    def remove_document(self, doc_id, publish=True):
+        return self._call("remove", doc_id=doc_id)
+
+    def sync_directory(self, directory):
+        return self._call("sync", timeout=3600, directory=directory)
+
+    def cache_stats(self):
+        return self._call("cache_stats")
+
+    def memory_footprint(self, per_document=False):
+        return self._call("memory", per_document=per_document)
+
+class RetrievalSidecar:
+    def __init__(self, store: KnowledgeStore, assets_dir: str):
+        self.store = store
+        self.assets_dir = assets_dir
+        self.warming_up = True
+        # Why the warm-up failed, if it did; the store then serves whatever was published before the failure
+        self.warm_up_error = None
+
+    def _handle(self, request):
+        op = request["op"]
+        if op == "status":
+            return {"version": self.store.version, "documents": self.store.documents, "warming_up": self.warming_up,
+                    "error": self.warm_up_error}
+        if op == "resolve":
+            return self.store.resolve(request["doc_ids"], request["where"])
+        if op == "search":
+            views = [self.store.view(view["doc_ids"], view["where"]) for view in request["views"]]
+            results = self.store.search_views(request["prompt"], views, request["num_chunks"])
+            return [[asdict(chunk) for chunk in chunks] for chunks in results]
+        if op == "context":
+            views = [self.store.view(view["doc_ids"], view["where"]) for view in request["views"]]
+            return self.store.context_views(request["prompt"], views, request.get("num_chunks"))
+        if op == "upsert":
+            return self.store.upsert_pdf(request["path"], request.get("doc_id"), request.get("metadata"))
+        if op == "remove":
+            return self.store.remove_document(request["doc_id"])
+        if op == "sync":
+            return self.store.sync_directory(request["directory"])
+        if op == "cache_stats":
+            return self.store.cache_stats()
+        if op == "memory":
+            return self.store.memory_footprint(request.get("per_document", False))
+        raise ValueError(f"Unknown op: {op}")
+
+    async def serve_connection(self, reader, writer):
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+                response = {"result": await asyncio.to_thread(self._handle, request)}
+            except Exception as e:
+                logger.error(f"Request {line[:100]!r} failed: {str(e)}")
+                response = {"error": str(e)}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def warm_up(self):
+        try:
+            await asyncio.to_thread(lambda: self.store.model)
+            result = await asyncio.to_thread(self.store.sync_directory, self.assets_dir)
+            logger.info(f"Knowledge store ready: {result}")
+        except Exception as e:
+            self.warm_up_error = str(e)
+            logger.error(f"Knowledge store warm-up failed: {str(e)}")
+        finally:
+            self.warming_up = False
+
+async def run(socket_path: str, assets_dir: str):
+    sidecar = RetrievalSidecar(KnowledgeStore(), assets_dir)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(sidecar.serve_connection, path=socket_path)
+    os.chmod(socket_path, 0o600)
+    logger.info(f"Retrieval sidecar listening on {socket_path}")
+    warm_up = asyncio.create_task(sidecar.warm_up())
+    async with server:
+        await server.serve_forever()
+    warm_up.cancel()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=config.RAG_SIDECAR_SOCKET or "/tmp/council-rag.sock")
+    parser.add_argument("--assets", default="assets")
+    args = parser.parse_args()
+    asyncio.run(run(args.socket, args.assets))
+
+if __name__ == "__main__":
+    main()
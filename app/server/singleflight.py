@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution whose result (or
+    exception) is shared by every caller. The execution is cancelled only when every
+    caller waiting on it has been cancelled, e.g. when all clients disconnected.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.stats = {"executions": 0, "coalesced": 0, "abandoned": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, executed): executed is False for callers that shared another caller's execution."""
+        flight = self._flights.get(key)
+        executed = flight is None
+        if executed:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._forget(key, flight))
+            self.stats["executions"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        flight.waiters += 1
+        try:
+            # Shielded so one caller's cancellation doesn't cancel the shared execution
+            return await asyncio.shield(flight.task), executed
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                logger.info("All callers gone, cancelling coalesced execution")
+                self.stats["abandoned"] += 1
+                flight.task.cancel()
+                self._forget(key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -1,3 +1,5 @@
+import time
+
 from gemini import Gemini, init_model
 
 
@@ -55,6 +57,52 @@ def multiple_questions_example():
         print(f"A{i}: {response}\n")
 
 
+def throughput_example():
+    """Example 5: Many independent questions at once"""
+    print("=== Example 5: Concurrent Questions (Throughput) ===")
+
+    # Cache answers, so asking the same question again costs no API call
+    gemini = init_model("gemini-2.0-flash", cache_size=100)
+
+    questions = [
+        "What is a CPU?",
+        "What is RAM?",
+        "What is a GPU?",
+        "What is an SSD?",
+        "What is a motherboard?",
+        "What is a network card?"
+    ]
+
+    # One after another
+    start = time.perf_counter()
+    for question in questions[:3]:
+        gemini.ask_once(question)
+    sequential = time.perf_counter() - start
+    print(f"Sequential: 3 questions in {sequential:.1f}s")
+
+    # All at once - answers come back in the same order as the questions
+    start = time.perf_counter()
+    answers = gemini.ask_many(questions[3:], max_concurrency=3)
+    concurrent = time.perf_counter() - start
+    print(f"ask_many:   3 questions in {concurrent:.1f}s")
+
+    # Asking again is answered from the cache
+    start = time.perf_counter()
+    answers = gemini.ask_many(questions)
+    print(f"Cached:     {len(questions)} questions in {time.perf_counter() - start:.2f}s, cache: {gemini.cache_info()}")
+
+    for question, answer in zip(questions, answers):
+        print(f"Q: {question}\nA: {answer}\n")
+
+    # Separate conversations, e.g. one per user of a web app
+    alice, bob = gemini.new_conversation(), gemini.new_conversation()
+    alice.ask("My favourite language is Python. Remember it.")
+    bob.ask("My favourite language is Java. Remember it.")
+    print(f"Alice's favourite: {alice.ask('What is my favourite language?')}")
+    print(f"Bob's favourite: {bob.ask('What is my favourite language?')}")
+    print()
+
+
 def model_info_example():
     """Example 6: Getting model information"""
     print("=== Example 6: Model Information ===")
@@ -81,6 +129,7 @@ def main():
         specific_model_example,
         long_answer_example,
         multiple_questions_example,
+        throughput_example,
         model_info_example
     ]
 
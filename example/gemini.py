@@ -1,3 +1,10 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import google.generativeai as genai
 import google.auth
 
@@ -6,9 +13,15 @@ class Gemini:
     """
     Simple Gemini API client - use as a black box
     Just call init_model() with your preferred model and use ask()
+    
+    For scripts and services that need throughput, ask_once(), ask_async() and ask_many()
+    answer independent questions (no shared history) concurrently, and new_conversation()
+    gives every user their own chat.
     """
 
     _API_KEY_FILE = "api_key.json"
+    # Used when no model is given and there is nobody to ask, e.g. in scripts and services
+    DEFAULT_MODEL = "gemini-1.5-flash"
 
     # Available models with descriptions
     AVAILABLE_MODELS = {
@@ -24,25 +37,37 @@ class Gemini:
         self.model = None
         self.chat = None
         self.model_name = None
+        self.max_concurrency = 8
         self._initialized = False
+        self._chat_lock = threading.Lock()
+        self._cache = None
 
-    def init_model(self, model_name=None):
+    def init_model(self, model_name=None, interactive=None, cache_size=0, max_concurrency=8):
         """
         Initialize Gemini model - call this once before using ask()
         
         Args:
-            model_name (str, optional): Model to use. If None, shows selection menu.
-            
+            model_name (str, optional): Model to use. If None, the GEMINI_MODEL environment
+                variable, then the selection menu (interactive) or DEFAULT_MODEL decide.
+            interactive (bool, optional): Whether the selection menu may be shown.
+                Defaults to True when running in a terminal.
+            cache_size (int): Remember up to this many answers of ask_once/ask_async/ask_many (0 = off)
+            max_concurrency (int): Default number of questions ask_many sends at once
+        
         Returns:
             Gemini: Ready-to-use Gemini instance
-            
+        
         Raises:
             Exception: If initialization fails
         """
         try:
-            # If no model specified, let user choose
+            # If no model specified, use the environment, let user choose, or fall back to the default
+            if model_name is None:
+                model_name = os.getenv("GEMINI_MODEL")
             if model_name is None:
-                model_name = self._select_model()
+                if interactive is None:
+                    interactive = sys.stdin is not None and sys.stdin.isatty()
+                model_name = self._select_model() if interactive else self.DEFAULT_MODEL
 
             # Validate model
             if model_name not in self.AVAILABLE_MODELS:
@@ -64,6 +89,8 @@ class Gemini:
             self.model = genai.GenerativeModel(model_name)
             self.chat = self.model.start_chat()
             self.model_name = model_name
+            self.max_concurrency = max_concurrency
+            self._cache = _ResponseCache(cache_size) if cache_size > 0 else None
             self._initialized = True
 
             print(f"✅ Gemini {model_name} is ready!")
@@ -76,36 +103,122 @@ class Gemini:
         """
         Ask Gemini a question and get a response
         
+        Questions share one conversation, so follow-up questions work. Use new_conversation()
+        for separate conversations, or ask_once() for questions that stand on their own.
+        
         Args:
             question (str): The question to ask
             short_answer (bool): Whether to request a concise answer
-            
+        
         Returns:
             str: Gemini's response
-            
+        
         Raises:
             Exception: If not initialized or API error occurs
         """
-        if not self._initialized:
-            raise Exception("Model not initialized. Call init_model() first!")
-
-        if not question or not question.strip():
-            raise ValueError("Question cannot be empty")
+        prompt = self._prepare_prompt(question, short_answer)
 
         try:
-            # Prepare prompt
-            if short_answer:
-                prompt = f"{question}\n\nPlease provide a short, concise answer with minimal explanation."
-            else:
-                prompt = question
-
-            # Get response
-            response = self.chat.send_message(prompt)
+            # One message at a time, so the shared history stays in order across threads
+            with self._chat_lock:
+                response = self.chat.send_message(prompt)
             return response.text
 
         except Exception as e:
             raise Exception(f"Error getting response: {e}")
 
+    def ask_once(self, question, short_answer=True):
+        """
+        Ask a single, independent question (no conversation history)
+        
+        Safe to call from many threads at once. Answers are cached when init_model()
+        was given a cache_size.
+        
+        Args:
+            question (str): The question to ask
+            short_answer (bool): Whether to request a concise answer
+        
+        Returns:
+            str: Gemini's response
+        """
+        prompt = self._prepare_prompt(question, short_answer)
+        key = (self.model_name, prompt)
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            answer = self.model.generate_content(prompt).text
+        except Exception as e:
+            raise Exception(f"Error getting response: {e}")
+
+        if self._cache is not None:
+            self._cache.put(key, answer)
+        return answer
+
+    async def ask_async(self, question, short_answer=True):
+        """
+        Async version of ask_once() for asyncio code - doesn't block the event loop
+        
+        Returns:
+            str: Gemini's response
+        """
+        return await asyncio.to_thread(self.ask_once, question, short_answer)
+
+    def ask_many(self, questions, short_answer=True, max_concurrency=None, return_exceptions=False):
+        """
+        Ask many independent questions at once
+        
+        Args:
+            questions (list): The questions to ask
+            short_answer (bool): Whether to request concise answers
+            max_concurrency (int, optional): Questions in flight at once (default: init_model's max_concurrency)
+            return_exceptions (bool): Put errors in the result list instead of raising the first one
+        
+        Returns:
+            list: Answers in the same order as the questions
+        """
+        self._check_initialized()
+
+        def answer(question):
+            try:
+                return self.ask_once(question, short_answer)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=max_concurrency or self.max_concurrency) as executor:
+            return list(executor.map(answer, questions))
+
+    async def ask_many_async(self, questions, short_answer=True, max_concurrency=None, return_exceptions=False):
+        """
+        Async version of ask_many() - answers come back in the same order as the questions
+        """
+        self._check_initialized()
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def answer(question):
+            async with semaphore:
+                return await self.ask_async(question, short_answer)
+
+        return await asyncio.gather(*(answer(question) for question in questions), return_exceptions=return_exceptions)
+
+    def new_conversation(self):
+        """
+        Start an independent conversation with its own history
+        
+        Returns:
+            Conversation: Use conversation.ask() for questions with follow-ups
+        """
+        self._check_initialized()
+        return Conversation(self)
+
+    def cache_info(self):
+        """Answer cache statistics, or None if caching is off"""
+        return self._cache.info() if self._cache is not None else None
+
     def get_model_name(self):
         """Get the current model name"""
         return self.model_name if self._initialized else None
@@ -116,6 +229,21 @@ class Gemini:
 
     # ========== PRIVATE METHODS (HIDDEN FROM STUDENTS) ==========
 
+    def _check_initialized(self):
+        if not self._initialized:
+            raise Exception("Model not initialized. Call init_model() first!")
+
+    def _prepare_prompt(self, question, short_answer):
+        """Validate the question and add the short answer instruction"""
+        self._check_initialized()
+
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+
+        if short_answer:
+            return f"{question}\n\nPlease provide a short, concise answer with minimal explanation."
+        return question
+
     def _select_model(self):
         """Interactive model selection (hidden implementation)"""
         print("📋 Available Gemini Models:")
@@ -151,15 +279,87 @@ class Gemini:
                 exit(0)
 
 
-def init_model(model_name=None):
+class Conversation:
+    """
+    An independent chat with its own history - create one per user or task with
+    gemini.new_conversation(). Safe to share between threads: messages are sent one at a time.
+    """
+
+    def __init__(self, gemini):
+        self._gemini = gemini
+        self._chat = gemini.model.start_chat()
+        self._lock = threading.Lock()
+
+    def ask(self, question, short_answer=True):
+        """
+        Ask a question in this conversation; earlier questions and answers are remembered
+        
+        Args:
+            question (str): The question to ask
+            short_answer (bool): Whether to request a concise answer
+        
+        Returns:
+            str: Gemini's response
+        """
+        prompt = self._gemini._prepare_prompt(question, short_answer)
+        try:
+            with self._lock:
+                return self._chat.send_message(prompt).text
+        except Exception as e:
+            raise Exception(f"Error getting response: {e}")
+
+    async def ask_async(self, question, short_answer=True):
+        """Like ask(), without blocking the event loop"""
+        return await asyncio.to_thread(self.ask, question, short_answer)
+
+    @property
+    def history(self):
+        """List of (role, text) pairs exchanged so far"""
+        with self._lock:
+            return [(message.role, message.parts[0].text) for message in self._chat.history]
+
+
+class _ResponseCache:
+    """Thread-safe LRU cache of answers, keyed by model and prompt (hidden implementation)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_entries}
+
+
+def init_model(model_name=None, **options):
     """
     Convenience function to create and initialize a Gemini instance
     
     Args:
-        model_name (str, optional): Model to use. If None, shows selection menu.
-        
+        model_name (str, optional): Model to use. If None, shows selection menu
+            when running in a terminal (see Gemini.init_model for the other options).
+    
     Returns:
         Gemini: Ready-to-use Gemini instance
     """
     gemini = Gemini()
-    return gemini.init_model(model_name)
+    return gemini.init_model(model_name, **options)